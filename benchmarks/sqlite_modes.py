@@ -0,0 +1,122 @@
+"""Compare the file SQLite storages under concurrent tool calls.
+
+Every mode runs in its own process (the storage is configured from the
+environment at import time) on a fresh database file:
+
+    python benchmarks/sqlite_modes.py [concurrency] [operations]
+
+For each mode it prints the throughput, how many calls failed (e.g. with
+`database is locked`) and the median latency of the read calls.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+MODES = {
+    "sqlite (async)": {"STORAGE_DB": "sqlite", "DB_EXECUTOR": "async"},
+    "sqlite (threadpool)": {"STORAGE_DB": "sqlite", "DB_EXECUTOR": "threadpool"},
+    "sqlite-prod (writer)": {"STORAGE_DB": "sqlite-prod", "SQLITE_READ_POOL_SIZE": "0"},
+    "sqlite-prod": {"STORAGE_DB": "sqlite-prod"},
+}
+
+STUDENTS = 200
+
+
+async def run_workload(concurrency: int, operations: int) -> None:
+    from storage import init_async_db, async_engine, run_in_session
+    from storage import run_read_in_session
+    from storage import init_db, engine, uses_blocking_executor
+    from user_group_db.models import Group, User
+
+    if uses_blocking_executor():
+        init_db(engine)
+    else:
+        await init_async_db(async_engine)
+
+    await run_in_session(User.create, user_id="teacher", username="teacher")
+    await run_in_session(
+        User.create_many,
+        [{"user_id": str(i), "username": f"student-{i}"} for i in range(STUDENTS)],
+    )
+    group = await run_in_session(Group.create, name="Class", owner_user_id="teacher")
+
+    async def operation(index: int) -> None:
+        username = f"student-{index % STUDENTS}"
+        kind = index % 4
+        if kind == 0:
+            await run_in_session(Group.add_user, group["id"], username)
+        elif kind == 1:
+            await run_in_session(Group.remove_user, group["id"], username)
+        elif kind == 2:
+            await run_read_in_session(Group.get_students, group["id"], limit=50)
+        else:
+            await run_read_in_session(User.get_lookup, str(index % STUDENTS))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = []
+    read_latencies = []
+
+    async def limited(index: int) -> None:
+        async with semaphore:
+            op_started_at = time.perf_counter()
+            try:
+                await operation(index)
+            except Exception as e:
+                errors.append(e)
+            if index % 4 >= 2:
+                read_latencies.append(time.perf_counter() - op_started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(limited(index) for index in range(operations)))
+    elapsed = time.perf_counter() - started_at
+
+    locked = sum("database is locked" in str(e) for e in errors)
+    kinds = sorted({type(e).__name__ for e in errors})
+    read_latencies.sort()
+    read_p50 = read_latencies[len(read_latencies) // 2] * 1000
+    print(
+        f"{operations / elapsed:8.0f} ops/s, read p50 {read_p50:6.1f} ms, "
+        f"{len(errors):5d} errors, {locked} `database is locked` {kinds or ''}"
+    )
+    await async_engine.dispose()
+
+
+def main() -> None:
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    if os.environ.get("BENCHMARK_CHILD"):
+        asyncio.run(run_workload(concurrency, operations))
+        return
+
+    print(f"concurrency {concurrency}, {operations} operations")
+    for name, env in MODES.items():
+        with tempfile.TemporaryDirectory() as workdir:
+            child_env = {
+                **os.environ,
+                **env,
+                "BENCHMARK_CHILD": "1",
+                "DEBUG_MODE": "1",
+                "SQLITE_PATH": os.path.join(workdir, "bench.db"),
+                "USERNAME_INDEX": "off",
+                "PYTHONPATH": os.path.abspath(SRC),
+            }
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *sys.argv[1:]],
+                cwd=workdir,
+                env=child_env,
+                capture_output=True,
+                text=True,
+            )
+            output = result.stdout.strip().splitlines()
+            summary = output[-1] if output else result.stderr.strip()[-200:]
+            print(f"{name:20s} {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import envs
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class TTLCache:
+    """In-process LRU cache with a per-entry TTL and hit/miss/eviction counters."""
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Return the cached value, or `default` if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class UserLookupCache:
+    """Read-through cache of `{"username", "is_activated"}` keyed by user_id.
+
+    Unknown user_ids are cached as None as well, so account creation has to
+    invalidate the new user_id. Write paths that only know the username use
+    `invalidate_username`, which follows the username -> user_id mapping
+    remembered when the entry was loaded.
+
+    A value loaded while its user_id got invalidated may be stale, so it is
+    returned but not cached: every user_id with a load in flight has a
+    generation bumped by invalidation and checked before storing.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.entries = TTLCache(max_size, ttl_seconds)
+        self._user_ids = TTLCache(max_size, ttl_seconds)
+        # user_id -> (loads in flight, generation)
+        self._loading: Dict[str, Tuple[int, int]] = {}
+
+    async def get_or_load(
+        self,
+        user_id: str,
+        loader: Callable[[str], Awaitable[Optional[dict]]],
+    ) -> Optional[dict]:
+        entry = self.entries.get(user_id)
+        if entry is not MISSING:
+            self._remember_username(user_id, entry)
+            return entry
+
+        loads, generation = self._loading.get(user_id, (0, 0))
+        self._loading[user_id] = (loads + 1, generation)
+        try:
+            entry = await loader(user_id)
+        finally:
+            loads, current_generation = self._loading.pop(user_id)
+            if loads > 1:
+                self._loading[user_id] = (loads - 1, current_generation)
+        if current_generation == generation:
+            self.entries.set(user_id, entry)
+            self._remember_username(user_id, entry)
+        else:
+            logger.debug(f"Not caching user_id {user_id} invalidated while loading")
+        return entry
+
+    def _remember_username(self, user_id: str, entry: Optional[dict]) -> None:
+        if entry and entry.get("username"):
+            # keep the reverse mapping at least as fresh as the entry
+            self._user_ids.set(entry["username"], user_id)
+
+    def invalidate_user_id(self, user_id: Optional[str]) -> None:
+        if user_id is not None:
+            self.entries.pop(user_id)
+            self._bump_generations([user_id])
+
+    def invalidate_username(self, username: Optional[str]) -> None:
+        if username is not None:
+            user_id = self._user_ids.pop(username)
+            if user_id is not None:
+                self.invalidate_user_id(user_id)
+            else:
+                # the username may belong to any of the loads in flight
+                self._bump_generations(list(self._loading))
+
+    def _bump_generations(self, user_ids: List[str]) -> None:
+        for user_id in user_ids:
+            if user_id in self._loading:
+                loads, generation = self._loading[user_id]
+                self._loading[user_id] = (loads, generation + 1)
+
+    def clear(self) -> None:
+        logger.info("User lookup cache cleared")
+        self.entries.clear()
+        self._user_ids.clear()
+        self._bump_generations(list(self._loading))
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+
+user_cache = UserLookupCache(envs.USER_CACHE_MAX_SIZE, envs.USER_CACHE_TTL_SECONDS)
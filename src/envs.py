@@ -2,6 +2,18 @@ import os
 
 STORAGE_DB = os.environ.get("STORAGE_DB", "sqlite-memory")
 
+##########
+# sqlite #
+##########
+# database file of the `sqlite-prod` storage
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "./users_groups.db")
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# how long other processes wait for the write lock
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# read-only connections (and executor workers) serving reads next to the
+# single writer, 0 sends reads to the writer as well
+SQLITE_READ_POOL_SIZE = int(os.environ.get("SQLITE_READ_POOL_SIZE", "4"))
+
 # tests set 1 by default in conftest.py
 # it add more output, for example SQL queries to db
 DEBUG_MODE = bool(int(os.environ.get("DEBUG_MODE", 0)))
@@ -13,6 +25,63 @@ PG_USER = os.environ.get("PG_USER")
 PG_PASSWORD = os.environ.get("PG_PASSWORD")
 PG_HOST = os.environ.get("PG_HOST")
 PG_PORT = os.environ.get("PG_PORT")
+# connection pool of the postgres engines (sync and asyncio)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+# seconds to wait for a free connection before failing
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# connections older than this are replaced, -1 keeps them forever
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+# test connections on checkout, drops stale ones after a failover
+DB_POOL_PRE_PING = bool(int(os.environ.get("DB_POOL_PRE_PING", "1")))
+
+###############
+# db executor #
+###############
+# how the blocking model calls are run off the event loop:
+# "async" - asyncio engine, "threadpool" - bounded pool of threads
+DB_EXECUTOR = os.environ.get("DB_EXECUTOR", "async")
+# 0 means "match the size of the engine connection pool"
+DB_EXECUTOR_WORKERS = int(os.environ.get("DB_EXECUTOR_WORKERS", "0"))
+# calls waiting for a free worker above this limit are rejected
+DB_EXECUTOR_MAX_QUEUE = int(os.environ.get("DB_EXECUTOR_MAX_QUEUE", "100"))
+
+
+##############
+# user cache #
+##############
+# read-through cache for the per-message user_id lookups, 0 disables it
+USER_CACHE_MAX_SIZE = int(os.environ.get("USER_CACHE_MAX_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))
+
+
+#############
+# usernames #
+#############
+# "agent", "local" (offline word lists) or "agent_with_local_fallback"
+USERNAME_GENERATOR = os.environ.get("USERNAME_GENERATOR", "agent_with_local_fallback")
+# the local generator is used when the agent does not answer in time
+AGENT_USERNAME_TIMEOUT_SECONDS = float(
+    os.environ.get("AGENT_USERNAME_TIMEOUT_SECONDS", "10")
+)
+
+# in-memory index of existing usernames: "set", "bloom" or "off".
+# it only sees writes of this process, use "off" with several replicas
+USERNAME_INDEX = os.environ.get("USERNAME_INDEX", "set")
+# bloom filter sizing
+USERNAME_INDEX_CAPACITY = int(os.environ.get("USERNAME_INDEX_CAPACITY", "1000000"))
+USERNAME_INDEX_ERROR_RATE = float(os.environ.get("USERNAME_INDEX_ERROR_RATE", "0.01"))
+
+#################
+# username pool #
+#################
+# pre-generated usernames for account creation, target 0 disables the pool
+USERNAME_POOL_TARGET = int(os.environ.get("USERNAME_POOL_TARGET", "100"))
+# the background worker refills the pool when it drops below this mark
+USERNAME_POOL_LOW_WATER = int(os.environ.get("USERNAME_POOL_LOW_WATER", "20"))
+USERNAME_POOL_CHECK_SECONDS = float(
+    os.environ.get("USERNAME_POOL_CHECK_SECONDS", "300")
+)
 
 
 MCP_HOST = os.environ.get("MCP_HOST", "0.0.0.0")
@@ -21,3 +90,18 @@ MCP_PORT = int(os.environ.get("MCP_PORT", "8000"))
 
 MCP_REGISTRY_ENDPOINT = os.environ.get("MCP_REGISTRY_ENDPOINT")
 AGENT_ENDPOINT = os.environ.get("AGENT_ENDPOINT")
+
+# a registry roles snapshot older than ROLE_CACHE_TTL_SECONDS is reloaded on read
+ROLE_CACHE_TTL_SECONDS = float(os.environ.get("ROLE_CACHE_TTL_SECONDS", "60"))
+
+######################
+# outbound http pool #
+######################
+# limits are applied per upstream (agent, registry)
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+# requires the optional `h2` package
+HTTP2_ENABLED = bool(int(os.environ.get("HTTP2_ENABLED", 0)))
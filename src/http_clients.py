@@ -0,0 +1,64 @@
+import envs
+import logging
+from typing import Dict
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+AGENT = "agent"
+REGISTRY = "registry"
+
+
+class HttpClients:
+    """App-lifetime pooled `httpx.AsyncClient`s, one per upstream.
+
+    Reusing a client keeps TCP/TLS connections to the upstream alive
+    between calls instead of paying a new handshake on every request.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _create_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=envs.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=envs.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=envs.HTTP_KEEPALIVE_EXPIRY,
+        )
+        if envs.HTTP2_ENABLED:
+            try:
+                return httpx.AsyncClient(limits=limits, http2=True)
+            except ImportError:
+                logger.warning("The `h2` package is not installed, using HTTP/1.1")
+        return httpx.AsyncClient(limits=limits)
+
+    def get(self, upstream: str) -> httpx.AsyncClient:
+        """Return the client for the upstream, creating it on first use."""
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = self._create_client()
+            self._clients[upstream] = client
+        return client
+
+    @property
+    def agent(self) -> httpx.AsyncClient:
+        return self.get(AGENT)
+
+    @property
+    def registry(self) -> httpx.AsyncClient:
+        return self.get(REGISTRY)
+
+    async def start(self) -> None:
+        for upstream in (AGENT, REGISTRY):
+            self.get(upstream)
+        logger.info("Outbound HTTP clients started")
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+        logger.info("Outbound HTTP clients closed")
+
+
+http_clients = HttpClients()
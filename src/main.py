@@ -1,36 +1,107 @@
+import asyncio
 import logging
 import json
-from typing import Annotated, List, Optional
+import time
+from typing import Annotated, Awaitable, List, Optional, Tuple, TypeVar
 
 from user_group_db.models import Group, User
-from storage import SessionLocal, engine, init_db
-
-from envs import MCP_HOST, MCP_PORT, MCP_REGISTRY_ENDPOINT, AGENT_ENDPOINT
+from storage import (
+    async_engine,
+    blocking_executor,
+    engine,
+    init_async_db,
+    init_db,
+    pool_stats,
+    read_executor,
+    run_in_session,
+    run_read_in_session,
+    uses_blocking_executor,
+)
+from cache import user_cache
+from role_cache import RegistryError, role_cache
+from username_generator import (
+    LIMIT_ATTEMPTS,
+    UsernameGenerationError,
+    generate_free_username,
+)
+from username_pool import username_pool
+from username_index import username_index
+
+from envs import (
+    AGENT_ENDPOINT,
+    DEBUG_MODE,
+    MCP_HOST,
+    MCP_PORT,
+    MCP_REGISTRY_ENDPOINT,
+)
 from fastmcp import FastMCP
+from sqlalchemy.exc import IntegrityError
 from starlette.requests import Request
 from starlette.responses import JSONResponse
-import httpx
+from http_clients import http_clients
 
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(thread)d - %(message)s",
-    level=logging.INFO,
+    level=logging.DEBUG if DEBUG_MODE else logging.INFO,
 )
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 mcp_server = FastMCP(name="users-groups-mcp")
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def check_page_limit(limit: int) -> int:
+    """Return the page size to use, capped at MAX_PAGE_SIZE.
+
+    Raises ValueError if `limit` is less than 1.
+    """
+    if limit < 1:
+        raise ValueError(f"Limit must be at least 1, got {limit}")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def split_page(rows: List[dict], limit: int) -> Tuple[List[dict], Optional[int]]:
+    """Split rows fetched with `limit + 1` into the page and the next cursor.
+
+    `limit` must be validated with `check_page_limit`.
+    """
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1]["id"]
+    return rows, None
+
+
+async def timed(awaitable: Awaitable[T]) -> Tuple[T, float]:
+    """Await and return the result with the elapsed seconds."""
+    started_at = time.perf_counter()
+    result = await awaitable
+    return result, time.perf_counter() - started_at
+
+
+def format_next_cursor(next_cursor: Optional[int]) -> str:
+    if next_cursor is None:
+        return ""
+    return f"\nNext cursor: {next_cursor}"
+
+
+async def load_user_lookup(user_id: str) -> Optional[dict]:
+    return await run_read_in_session(User.get_lookup, user_id)
+
 
 @mcp_server.custom_route("/get_username_by_user_id", methods=["POST"])
 async def http_get_username_by_user_id(request: Request):
     data = await request.json()
     user_id = data.get("user_id")
     logger.info(f"Getting username for user ID: {user_id}")
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.user_id == user_id).first()
-        logger.info(f"User: {user}")
-        return JSONResponse({"username": user.username if user else None})
+    user = await user_cache.get_or_load(user_id, load_user_lookup)
+    username = user["username"] if user else None
+    logger.info(f"Username: {username}")
+    return JSONResponse({"username": username})
 
 
 @mcp_server.custom_route("/check_username_exists", methods=["POST"])
@@ -38,10 +109,9 @@ async def http_check_username_exists(request: Request):
     data = await request.json()
     username = data.get("username")
     logger.info(f"Checking username exists: {username}")
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.username == username).first()
-        logger.info(f"User: {user}")
-        return JSONResponse({"exists": user is not None})
+    exists = await run_read_in_session(User.username_exists, username)
+    logger.info(f"Username exists: {exists}")
+    return JSONResponse({"exists": exists})
 
 
 @mcp_server.custom_route("/get_user_id", methods=["POST"])
@@ -49,10 +119,9 @@ async def http_get_user_id(request: Request):
     data = await request.json()
     username = data.get("username")
     logger.info(f"Getting user ID for username: {username}")
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.username == username).first()
-        logger.info(f"User: {user}")
-        return JSONResponse({"user_id": user.user_id})
+    user_id = await run_read_in_session(User.get_user_id_by_username, username)
+    logger.info(f"User ID: {user_id}")
+    return JSONResponse({"user_id": user_id})
 
 
 @mcp_server.custom_route("/set_user_id_for_username", methods=["POST"])
@@ -61,12 +130,10 @@ async def http_set_user_id_for_username(request: Request):
     username = data.get("username")
     user_id = data.get("user_id")
     logger.info(f"Setting user ID for username: {username} to {user_id}")
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.username == username).first()
-        user.user_id = user_id
-        session.commit()
-        logger.info(f"User: {user}")
-        return JSONResponse({"success": True})
+    success = await run_in_session(User.set_user_id, username, user_id)
+    user_cache.invalidate_username(username)
+    user_cache.invalidate_user_id(user_id)
+    return JSONResponse({"success": success})
 
 
 @mcp_server.custom_route("/check_user_id_activated", methods=["POST"])
@@ -75,10 +142,84 @@ async def http_check_user_id_activated(request: Request):
     data = await request.json()
     user_id = data.get("user_id")
     logger.info(f"Checking user ID activated: {user_id}")
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.user_id == user_id).first()
-        logger.info(f"User: {user}")
-        return JSONResponse({"activated": user.is_activated if user else False})
+    user = await user_cache.get_or_load(user_id, load_user_lookup)
+    activated = bool(user and user["is_activated"])
+    logger.info(f"Activated: {activated}")
+    return JSONResponse({"activated": activated})
+
+
+def invalid_list_response(key: str) -> JSONResponse:
+    return JSONResponse(
+        {"success": False, "error": f"`{key}` must be a list"}, status_code=400
+    )
+
+
+@mcp_server.custom_route("/get_usernames_by_user_ids", methods=["POST"])
+async def http_get_usernames_by_user_ids(request: Request):
+    data = await request.json()
+    user_ids = data.get("user_ids")
+    if not isinstance(user_ids, list):
+        return invalid_list_response("user_ids")
+    logger.info(f"Getting usernames for {len(user_ids)} user IDs")
+    usernames = await run_read_in_session(User.get_usernames_by_user_ids, user_ids)
+    return JSONResponse({"usernames": usernames})
+
+
+@mcp_server.custom_route("/get_user_ids", methods=["POST"])
+async def http_get_user_ids(request: Request):
+    data = await request.json()
+    usernames = data.get("usernames")
+    if not isinstance(usernames, list):
+        return invalid_list_response("usernames")
+    logger.info(f"Getting user IDs for {len(usernames)} usernames")
+    user_ids = await run_read_in_session(User.get_user_ids_by_usernames, usernames)
+    return JSONResponse({"user_ids": user_ids})
+
+
+@mcp_server.custom_route("/check_usernames_exist", methods=["POST"])
+async def http_check_usernames_exist(request: Request):
+    data = await request.json()
+    usernames = data.get("usernames")
+    if not isinstance(usernames, list):
+        return invalid_list_response("usernames")
+    logger.info(f"Checking {len(usernames)} usernames exist")
+    existing = await run_read_in_session(User.get_existing_usernames, usernames)
+    return JSONResponse(
+        {"exists": {username: username in existing for username in usernames}}
+    )
+
+
+@mcp_server.custom_route("/check_user_ids_activated", methods=["POST"])
+async def http_check_user_ids_activated(request: Request):
+    data = await request.json()
+    user_ids = data.get("user_ids")
+    if not isinstance(user_ids, list):
+        return invalid_list_response("user_ids")
+    logger.info(f"Checking {len(user_ids)} user IDs activated")
+    activated = await run_read_in_session(User.get_activated_by_user_ids, user_ids)
+    return JSONResponse({"activated": activated})
+
+
+async def create_account(**fields) -> str:
+    """Create a user with a username from the pool and return the username.
+
+    The username can still be taken by another request right before the
+    insert, then the account is retried with the next one. Raises
+    UsernameGenerationError when no username is left to try and
+    IntegrityError for any other conflict (e.g. a known user_id).
+    """
+    for _ in range(LIMIT_ATTEMPTS):
+        username = await username_pool.acquire()
+        try:
+            await run_in_session(User.create, username=username, **fields)
+            return username
+        except IntegrityError:
+            # asks the DB, the username index misses other processes' users
+            found, _ = await run_read_in_session(User.resolve_usernames, [username])
+            if not found:
+                raise
+            logger.warning(f"Username {username} was taken meanwhile, retrying")
+    raise UsernameGenerationError("Username already exists")
 
 
 @mcp_server.tool(tags=["admin"])
@@ -86,20 +227,13 @@ async def create_new_teacher_account() -> str:
     """Create a new teacher activated account."""
     logger.info("Creating new teacher account")
 
-    response = await generate_username()
-    logger.info(f"Response from generate_username: {response}")
-
-    body = json.loads(response.body.decode("utf-8"))
-
-    if response.status_code != 200:
-        logger.error(f"Error creating new teacher account: {body.get('error')}")
-        return body.get("error")
-
-    username = body.get("username")
+    try:
+        username = await create_account(is_activated=True)
+    except UsernameGenerationError as e:
+        logger.error(f"Error creating new teacher account: {e}")
+        return str(e)
 
-    with SessionLocal() as session:
-        User.create(username=username, is_activated=True, session=session)
-        return f"Teacher account created successfully with username: {username}"
+    return f"Teacher account created successfully with username: {username}"
 
 
 @mcp_server.custom_route("/create_student_account", methods=["POST"])
@@ -107,28 +241,150 @@ async def http_create_student_account(request: Request):
     data = await request.json()
     student_user_id = data.get("user_id")
 
-    response = await generate_username()
-    logger.info(f"Response from generate_username: {response}")
+    try:
+        # a teacher activates the student account adding into the group
+        username = await create_account(is_activated=False, user_id=student_user_id)
+    except UsernameGenerationError as e:
+        logger.error(f"Error creating new student account: {e}")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    except IntegrityError:
+        logger.error(f"Student account with user_id {student_user_id} exists")
+        return JSONResponse(
+            {"success": False, "error": "Student account already exists"},
+            status_code=409,
+        )
+    user_cache.invalidate_user_id(student_user_id)
+    return JSONResponse({"success": True, "username": username}, status_code=200)
+
+
+async def onboard_students(
+    user_ids: List[str],
+    group_id: Optional[int] = None,
+    teacher_user_id: Optional[str] = None,
+) -> List[dict]:
+    """Create student accounts for all user_ids in one transaction.
+
+    Usernames are taken from the pool in one batch. With `group_id` the
+    students are activated and added to the teacher's group. Returns one
+    result per distinct user_id. Raises ValueError if the group is not
+    owned by the teacher, and IntegrityError if some user_id got an account
+    meanwhile. Usernames taken meanwhile are replaced and the batch is
+    retried, like in `create_account`.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if group_id is not None and not await run_read_in_session(
+        Group.is_owned_by, group_id, teacher_user_id
+    ):
+        raise ValueError(f"Group with ID {group_id} is not owned by {teacher_user_id}")
+
+    existing = await run_read_in_session(User.get_existing_user_ids, user_ids)
+    new_user_ids = [user_id for user_id in user_ids if user_id not in existing]
+    usernames = await username_pool.acquire_many(len(new_user_ids))
+    for _ in range(LIMIT_ATTEMPTS):
+        try:
+            created = await run_in_session(
+                User.create_many,
+                [
+                    {"user_id": user_id, "username": username}
+                    for user_id, username in zip(new_user_ids, usernames)
+                ],
+                group_id=group_id,
+            )
+            break
+        except IntegrityError:
+            # asks the DB, the username index misses other processes' users
+            taken, _ = await run_read_in_session(User.resolve_usernames, usernames)
+            if not taken:
+                raise
+            logger.warning(f"Usernames {list(taken)} were taken meanwhile, retrying")
+            kept = [username for username in usernames if username not in taken]
+            replacements = iter(
+                await username_pool.acquire_many(len(taken), exclude=kept)
+            )
+            usernames = [
+                next(replacements) if username in taken else username
+                for username in usernames
+            ]
+    else:
+        raise UsernameGenerationError("Username already exists")
+    for user_id in new_user_ids:
+        user_cache.invalidate_user_id(user_id)
+
+    created_usernames = {row["user_id"]: row["username"] for row in created}
+    results = []
+    for user_id in user_ids:
+        if user_id in created_usernames:
+            results.append(
+                {
+                    "user_id": user_id,
+                    "success": True,
+                    "username": created_usernames[user_id],
+                }
+            )
+        else:
+            results.append(
+                {"user_id": user_id, "success": False, "error": "User already exists"}
+            )
+    return results
+
 
-    body = json.loads(response.body.decode("utf-8"))
+@mcp_server.custom_route("/create_student_accounts", methods=["POST"])
+async def http_create_student_accounts(request: Request):
+    data = await request.json()
+    user_ids = data.get("user_ids")
+    if not isinstance(user_ids, list):
+        return invalid_list_response("user_ids")
+    logger.info(f"Creating {len(user_ids)} student accounts")
 
-    if response.status_code != 200:
-        logger.error(f"Error creating new student account: {body.get('error')}")
+    try:
+        results = await onboard_students(
+            user_ids,
+            group_id=data.get("group_id"),
+            teacher_user_id=data.get("teacher_user_id"),
+        )
+    except (UsernameGenerationError, ValueError) as e:
+        logger.error(f"Error creating student accounts: {e}")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    except IntegrityError as e:
+        # another request created some of these accounts meanwhile
+        logger.error(f"Conflict creating student accounts: {e}")
         return JSONResponse(
-            {"success": False, "error": body.get("error")}, status_code=400
+            {"success": False, "error": "Some student accounts already exist"},
+            status_code=409,
         )
+    return JSONResponse({"success": True, "results": results}, status_code=200)
 
-    username = body.get("username")
 
-    with SessionLocal() as session:
-        # a teacher activates the student account adding into the group
-        User.create(
-            username=username,
-            is_activated=False,
-            user_id=student_user_id,
-            session=session,
+@mcp_server.tool(tags=["teacher"])
+async def create_student_accounts(
+    teacher_user_id: Annotated[str, "User ID of the teacher"],
+    student_user_ids: Annotated[List[str], "User IDs of the students to onboard"],
+    group_id: Annotated[
+        Optional[int], "ID of the teacher's group to add the students to"
+    ] = None,
+) -> str:
+    """Create accounts for a whole class of students in one call."""
+    logger.info(
+        f"Creating {len(student_user_ids)} student accounts for {teacher_user_id}"
+    )
+    try:
+        results = await onboard_students(
+            student_user_ids, group_id=group_id, teacher_user_id=teacher_user_id
         )
-        return JSONResponse({"success": True, "username": username}, status_code=200)
+    except (UsernameGenerationError, ValueError) as e:
+        return f"Error creating student accounts: {str(e)}"
+    except Exception as e:
+        logger.error(f"Error creating student accounts: {e}")
+        return f"Database error: {str(e)}"
+
+    created = sum(result["success"] for result in results)
+    lines = [f"Created {created} of {len(results)} student accounts:"]
+    for result in results:
+        if result["success"]:
+            lines.append(f"- {result['user_id']}: {result['username']}")
+        else:
+            lines.append(f"- {result['user_id']}: {result['error']}")
+    return "\n".join(lines)
 
 
 @mcp_server.custom_route("/generate_username", methods=["GET"])
@@ -138,78 +394,18 @@ async def generate_username() -> JSONResponse:
     """
     logger.info("Generating username")
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        limit_attempts = 3
-        attempts = 0
-        while attempts < limit_attempts:
-            url = f"{AGENT_ENDPOINT}/message"
-            payload = {
-                "message": "Generate a kids friendly funny sounding username contains of some animal and adjective",
-                "structured_output": True,
-                "user_id": "service",
-                "role": "service",
-                "json_schema": {
-                    "name": "username_record",  # required by OpenAI structured outputs
-                    "strict": True,
-                    "schema": {
-                        "type": "object",
-                        "additionalProperties": False,
-                        "properties": {
-                            "username": {"type": "string"},
-                        },
-                        "required": ["username"],
-                    },
-                },
-            }
-            response = await client.post(url, json=payload)
-            logger.info(f"Response: {response.json()}")
-
-            if response.status_code != 200:
-                logger.error(f"Error generating username: {response.text}")
-                return JSONResponse(
-                    {"success": False, "error": "Error generating username"},
-                    status_code=400,
-                )
-
-            data = response.json()
-            message = json.loads(data.get("message", ""))
-            username = message.get("username")
-
-            if not username:
-                logger.error("Username is empty")
-                return JSONResponse(
-                    {"success": False, "error": "Username is empty"},
-                    status_code=400,
-                )
-
-            with SessionLocal() as session:
-                # check if username already exists
-                existing_user = (
-                    session.query(User).filter(User.username == username).first()
-                )
-                if existing_user:
-                    logger.info(f"Username {username} already exists")
-                    attempts += 1
-                    continue
-
-            break
-
-        if attempts == limit_attempts:
-            return JSONResponse(
-                {
-                    "success": False,
-                    "error": "Username already exists",
-                },
-                status_code=400,
-            )
-
-        return JSONResponse(
-            {
-                "username": username,
-                "success": True,
-            },
-            status_code=200,
-        )
+    try:
+        username = await generate_free_username()
+    except UsernameGenerationError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+
+    return JSONResponse(
+        {
+            "username": username,
+            "success": True,
+        },
+        status_code=200,
+    )
 
 
 @mcp_server.tool(tags=["teacher"])
@@ -227,31 +423,32 @@ async def create_an_excercise_for_a_student(
         f"Calling an agent to create an excercise for student: {student_username}, message: {excercise_creation_instruction}"
     )
 
-    with SessionLocal() as session:
-        student = session.query(User).filter(User.username == student_username).first()
-        if not student:
-            logger.error(f"Student with username {student_username} not found")
-            return f"Student with username {student_username} not found"
-        student_user_id = student.user_id
+    student_user_id = await run_read_in_session(
+        User.get_user_id_by_username, student_username
+    )
+
+    if not student_user_id:
+        logger.error(f"Student with username {student_username} not found")
+        return f"Student with username {student_username} not found"
 
     logger.info(f"Student user ID: {student_user_id}")
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        url = f"{AGENT_ENDPOINT}/message"
-        payload = {
-            "message": excercise_creation_instruction,
-            "user_id": student_user_id,
-            "role": "student",
-        }
-        response = await client.post(url, json=payload)
-        logger.info(f"Response: {response}")
-        logger.info(f"Response text: {response.text}")
-        if response.status_code != 200:
-            return f"Error calling agent: {response.text}"
+    client = http_clients.agent
+    url = f"{AGENT_ENDPOINT}/message"
+    payload = {
+        "message": excercise_creation_instruction,
+        "user_id": student_user_id,
+        "role": "student",
+    }
+    response = await client.post(url, json=payload, timeout=120.0)
+    logger.info(f"Response: {response}")
+    logger.info(f"Response text: {response.text}")
+    if response.status_code != 200:
+        return f"Error calling agent: {response.text}"
 
-        data = response.json()
-        message = data.get("message", "")
-        return json.dumps({"excercise": message})
+    data = response.json()
+    message = data.get("message", "")
+    return json.dumps({"excercise": message})
 
 
 @mcp_server.tool(tags=["admin", "debug"])
@@ -265,22 +462,24 @@ async def create_user(
     logger.info(
         f"Creating user: {username}, user_id: {user_id}, is_activated: {is_activated}"
     )
-    with SessionLocal() as session:
-        User.create(
-            username=username,
-            session=session,
-            user_id=user_id,
-            is_activated=is_activated,
-        )
+    await run_in_session(
+        User.create,
+        username=username,
+        user_id=user_id,
+        is_activated=is_activated,
+    )
+    user_cache.invalidate_user_id(user_id)
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.post(
-            f"{MCP_REGISTRY_ENDPOINT}/register_user",
-            json={"user_id": user_id, "role_name": role},
-        )
-        if response.status_code != 200:
-            return f"Error registering user: {response.text}"
-        return f"User {username} created successfully"
+    client = http_clients.registry
+    response = await client.post(
+        f"{MCP_REGISTRY_ENDPOINT}/register_user",
+        json={"user_id": user_id, "role_name": role},
+        timeout=30.0,
+    )
+    if response.status_code != 200:
+        return f"Error registering user: {response.text}"
+    role_cache.set_role(user_id, role)
+    return f"User {username} created successfully"
 
 
 @mcp_server.tool(tags=["teacher"])
@@ -302,20 +501,24 @@ async def create_group(
         logger.info("No students usernames add to the group")
 
     try:
-        with SessionLocal() as session:
-            group = Group.create(
-                name=name,
-                usernames=students_usernames,
-                description=description,
-                session=session,
-                owner_user_id=teacher_user_id,
-            )
-            result = f"Group '{name}' created successfully with ID: {group['id']}"
-            if students_usernames:
-                result += f"\nAdded {group['added_users_count']} users to the group"
-                if len(students_usernames) > group["added_users_count"]:
-                    result += "\nWarning: Not all students were added to the group"
-            return result
+        group = await run_in_session(
+            Group.create,
+            name=name,
+            usernames=students_usernames,
+            description=description,
+            owner_user_id=teacher_user_id,
+        )
+        for username in students_usernames or []:
+            user_cache.invalidate_username(username)
+        result = f"Group '{name}' created successfully with ID: {group['id']}"
+        if students_usernames:
+            result += f"\nAdded {group['added_users_count']} users to the group"
+            if group["not_found_usernames"]:
+                result += (
+                    "\nWarning: Not all students were added to the group, "
+                    f"not found: {', '.join(group['not_found_usernames'])}"
+                )
+        return result
     except ValueError as e:
         return f"Error creating group: {str(e)}"
     except Exception as e:
@@ -323,18 +526,6 @@ async def create_group(
         return f"Database error: {str(e)}"
 
 
-async def check_teacher_owner_of_group(group_id: int, teacher_user_id: str) -> bool:
-    with SessionLocal() as session:
-        group = session.query(Group).filter(Group.id == group_id).first()
-        if not group:
-            logger.error(f"Group with ID {group_id} not found")
-            return False
-        if group.owner.user_id != teacher_user_id:
-            logger.error(f"Group with ID {group_id} is not owned by {teacher_user_id}")
-            return False
-        return True
-
-
 @mcp_server.tool(tags=["teacher"])
 async def delete_group(
     group_id: Annotated[int, "ID of the group to delete"],
@@ -342,28 +533,28 @@ async def delete_group(
 ) -> str:
     """Delete a group by its ID."""
     logger.info(f"Deleting group: {group_id} owned by {teacher_user_id}")
-    try:
-        with SessionLocal() as session:
-            is_allowed = await check_teacher_owner_of_group(group_id, teacher_user_id)
-            if not is_allowed:
-                return f"Group with ID {group_id} is not owned by {teacher_user_id}"
-
-            for user in session.query(User).filter(User.groups.contains(group_id)):
-                if user.user_id == teacher_user_id:
-                    # do not deactivate the teacher
-                    continue
-                if len(user.groups) == 1:
-                    # if it is the last group, deactivate the user
-                    logger.info(
-                        f"Deactivating user {user.user_id} because it is the last group"
-                    )
-                    user.is_activated = False
-
-            success = Group.delete_by_id(group_id, session)
-        if success:
+
+    def _delete_group(session) -> str:
+        if not Group.is_owned_by(group_id, teacher_user_id, session):
+            return f"Group with ID {group_id} is not owned by {teacher_user_id}"
+
+        # if it is the last group of a student, deactivate the student;
+        # it is committed together with the group deletion
+        teacher_id = session.query(User.id).filter(User.user_id == teacher_user_id)
+        deactivated = User.deactivate_last_group_members(
+            group_id, session, keep_id=teacher_id.scalar()
+        )
+        logger.info(f"Deactivating {deactivated} users because it is the last group")
+
+        if Group.delete_by_id(group_id, session):
             return f"Group with ID {group_id} deleted successfully"
-        else:
-            return f"Group with ID {group_id} not found"
+        return f"Group with ID {group_id} not found"
+
+    try:
+        result = await run_in_session(_delete_group)
+        # members may have been deactivated
+        user_cache.clear()
+        return result
     except Exception as e:
         logger.error(f"Error deleting group: {e}")
         return f"Database error: {str(e)}"
@@ -377,21 +568,25 @@ async def add_user_to_group(
 ) -> str:
     """Add a user to a group."""
     logger.info(f"Adding user {username} to group {group_id}")
-    try:
-        with SessionLocal() as session:
-            # check that the teacher can do this action
-            is_allowed = await check_teacher_owner_of_group(group_id, teacher_user_id)
-            if not is_allowed:
-                return f"Group with ID {group_id} is not owned by {teacher_user_id}"
-
-            user = session.query(User).filter(User.username == username).first()
-            if not user:
-                return f"User with username {username} not found"
-            Group.add_user(group_id, user.username, session)
-            user.is_activated = True
-            session.commit()
 
-            return f"User {username} added to group {group_id} successfully."
+    def _add_user_to_group(session) -> str:
+        # check that the teacher can do this action
+        if not Group.is_owned_by(group_id, teacher_user_id, session):
+            return f"Group with ID {group_id} is not owned by {teacher_user_id}"
+
+        user = session.query(User).filter(User.username == username).first()
+        if not user:
+            return f"User with username {username} not found"
+        Group.add_user(group_id, user.username, session)
+        user.is_activated = True
+        session.commit()
+
+        return f"User {username} added to group {group_id} successfully."
+
+    try:
+        result = await run_in_session(_add_user_to_group)
+        user_cache.invalidate_username(username)
+        return result
     except Exception as e:
         logger.error(f"Error adding user to group: {e}")
         return f"Database error: {str(e)}"
@@ -401,33 +596,40 @@ async def add_user_to_group(
 async def get_students_in_group(
     teacher_user_id: Annotated[str, "User ID of the teacher owner of the group"],
     group_id: Annotated[int, "ID of the group to retrieve"],
+    limit: Annotated[
+        int, f"Maximum number of students to return, at most {MAX_PAGE_SIZE}"
+    ] = DEFAULT_PAGE_SIZE,
+    cursor: Annotated[
+        Optional[int], "Next cursor from the previous page, empty for the first page"
+    ] = None,
 ) -> str:
-    """Get a list of all students in a group.
+    """Get a list of students in a group, one page at a time.
     It returns only activated students.
     """
-    logger.info(f"Getting all students in group {group_id}")
-    with SessionLocal() as session:
-        is_allowed = await check_teacher_owner_of_group(group_id, teacher_user_id)
-        if not is_allowed:
+    logger.info(f"Getting students in group {group_id}, cursor: {cursor}")
+    try:
+        limit = check_page_limit(limit)
+    except ValueError as e:
+        return str(e)
+
+    def _get_students_in_group(session) -> str:
+        if not Group.is_owned_by(group_id, teacher_user_id, session):
             return f"Group with ID {group_id} is not owned by {teacher_user_id}"
 
-        students = (
-            session.query(User)
-            .join(User.groups)
-            .filter(Group.id == group_id)
-            .filter(User.is_activated)
-            .all()
+        students = Group.get_students(
+            group_id, session, limit=limit + 1, after_id=cursor
         )
         if not students:
             return "No students found in the group"
 
+        students, next_cursor = split_page(students, limit)
         result = [
-            {"username": student.username, "user_id": student.user_id}
-            for student in students
+            {"username": student["username"], "user_id": student["user_id"]}
             for student in students
         ]
+        return str(result) + format_next_cursor(next_cursor)
 
-        return str(result)
+    return await run_read_in_session(_get_students_in_group)
 
 
 @mcp_server.tool(tags=["teacher"])
@@ -440,46 +642,156 @@ async def remove_user_from_group(
     logger.info(
         f"Removing user {username} from group {group_id} owned by {teacher_user_id}"
     )
+
+    def _remove_user_from_group(session) -> str:
+        if not Group.is_owned_by(group_id, teacher_user_id, session):
+            return f"Group with ID {group_id} is not owned by {teacher_user_id}"
+
+        success = Group.remove_user(group_id, username, session)
+        if not success:
+            return f"Failed to remove user {username} from group {group_id}. Check if both exist and user is in the group."
+
+        user = session.query(User).filter(User.username == username).first()
+
+        if user.user_id == teacher_user_id:
+            # do not deactivate the teacher
+            return f"User {username} is the teacher of the group {group_id}"
+
+        # if there is no more groups for the user, deactivate the user
+        if User.count_groups(user.id, session) == 0:
+            user.is_activated = False
+            session.commit()
+            logger.info(f"User {username} deactivated successfully")
+
+        return f"User {username} removed from group {group_id} successfully"
+
     try:
-        with SessionLocal() as session:
-            is_allowed = await check_teacher_owner_of_group(group_id, teacher_user_id)
-            if not is_allowed:
-                return f"Group with ID {group_id} is not owned by {teacher_user_id}"
-
-            success = Group.remove_user(group_id, username, session)
-            if success:
-                user = session.query(User).filter(User.username == username).first()
-
-                if user.user_id == teacher_user_id:
-                    # do not deactivate the teacher
-                    return f"User {username} is the teacher of the group {group_id}"
-
-                # if there is no more groups for the user, deactivate the user
-                if len(user.groups) == 0:
-                    user.is_activated = False
-                    session.commit()
-                    logger.info(f"User {username} deactivated successfully")
-
-                return f"User {username} removed from group {group_id} successfully"
-            else:
-                return f"Failed to remove user {username} from group {group_id}. Check if both exist and user is in the group."
+        result = await run_in_session(_remove_user_from_group)
+        user_cache.invalidate_username(username)
+        return result
     except Exception as e:
         logger.error(f"Error removing user from group: {e}")
         return f"Database error: {str(e)}"
 
 
+def format_membership_changes(result: dict) -> str:
+    """Format lists of usernames returned by Group.add_users/remove_users."""
+    return "\n".join(
+        f"{key.replace('_', ' ').capitalize()}: {', '.join(usernames)}"
+        for key, usernames in result.items()
+        if usernames
+    )
+
+
+@mcp_server.tool(tags=["teacher"])
+async def add_users_to_group(
+    teacher_user_id: Annotated[str, "User ID of the teacher owner of the group"],
+    group_id: Annotated[int, "ID of the group"],
+    usernames: Annotated[List[str], "Usernames of the users to add"],
+) -> str:
+    """Add several users to a group at once."""
+    logger.info(f"Adding {len(usernames)} users to group {group_id}")
+
+    def _add_users_to_group(session) -> str:
+        if not Group.is_owned_by(group_id, teacher_user_id, session):
+            return f"Group with ID {group_id} is not owned by {teacher_user_id}"
+        result = Group.add_users(group_id, usernames, session)
+        return format_membership_changes(result) or "No users given"
+
+    try:
+        result = await run_in_session(_add_users_to_group)
+        for username in usernames:
+            user_cache.invalidate_username(username)
+        return result
+    except Exception as e:
+        logger.error(f"Error adding users to group: {e}")
+        return f"Database error: {str(e)}"
+
+
+@mcp_server.tool(tags=["teacher"])
+async def remove_users_from_group(
+    teacher_user_id: Annotated[str, "User ID of the teacher owner of the group"],
+    group_id: Annotated[int, "ID of the group"],
+    usernames: Annotated[List[str], "Usernames of the users to remove"],
+) -> str:
+    """Remove several users from a group at once.
+    Students left without any group are deactivated.
+    """
+    logger.info(f"Removing {len(usernames)} users from group {group_id}")
+
+    def _remove_users_from_group(session) -> str:
+        if not Group.is_owned_by(group_id, teacher_user_id, session):
+            return f"Group with ID {group_id} is not owned by {teacher_user_id}"
+        result = Group.remove_users(group_id, usernames, session)
+        return format_membership_changes(result) or "No users given"
+
+    try:
+        result = await run_in_session(_remove_users_from_group)
+        for username in usernames:
+            user_cache.invalidate_username(username)
+        return result
+    except Exception as e:
+        logger.error(f"Error removing users from group: {e}")
+        return f"Database error: {str(e)}"
+
+
+@mcp_server.tool(tags=["teacher"])
+async def sync_group_roster(
+    teacher_user_id: Annotated[str, "User ID of the teacher owner of the group"],
+    group_id: Annotated[int, "ID of the group"],
+    usernames: Annotated[List[str], "Usernames of all users the group should have"],
+) -> str:
+    """Make the group members exactly the given users.
+    Only missing users are added and only extra users are removed.
+    """
+    logger.info(f"Syncing roster of group {group_id} to {len(usernames)} users")
+
+    def _sync_group_roster(session):
+        if not Group.is_owned_by(group_id, teacher_user_id, session):
+            return None
+        return Group.sync_roster(group_id, usernames, session)
+
+    try:
+        result = await run_in_session(_sync_group_roster)
+    except Exception as e:
+        logger.error(f"Error syncing group roster: {e}")
+        return f"Database error: {str(e)}"
+    if result is None:
+        return f"Group with ID {group_id} is not owned by {teacher_user_id}"
+
+    for username in result["added"] + result["removed"]:
+        user_cache.invalidate_username(username)
+    return format_membership_changes(result) or "Group roster is up to date"
+
+
 @mcp_server.tool(tags=["teacher"])
 async def get_available_groups(
     teacher_user_id: Annotated[str, "User ID of the teacher owner of the group"],
+    limit: Annotated[
+        int, f"Maximum number of groups to return, at most {MAX_PAGE_SIZE}"
+    ] = DEFAULT_PAGE_SIZE,
+    cursor: Annotated[
+        Optional[int], "Next cursor from the previous page, empty for the first page"
+    ] = None,
 ) -> str:
-    """Get a list of all groups in the database."""
-    logger.info(f"Getting all groups owned by {teacher_user_id}")
+    """Get a list of groups in the database, one page at a time."""
+    logger.info(f"Getting groups owned by {teacher_user_id}, cursor: {cursor}")
+    try:
+        limit = check_page_limit(limit)
+    except ValueError as e:
+        return str(e)
     try:
-        with SessionLocal() as session:
-            groups = Group.get_groups(session, teacher_user_id)
+        groups = await run_read_in_session(
+            Group.get_groups,
+            owner_user_id=teacher_user_id,
+            limit=limit + 1,
+            after_id=cursor,
+        )
         if not groups:
             return "No groups found in the database"
 
+        groups, next_cursor = split_page(groups, limit)
+
         result = [
             {
                 "id": group["id"],
@@ -490,7 +802,8 @@ async def get_available_groups(
             for group in groups
         ]
 
-        result = "Groups in the database owned by {teacher_user_id}:\n" + str(result)
+        result = f"Groups in the database owned by {teacher_user_id}:\n" + str(result)
+        result += format_next_cursor(next_cursor)
 
         return result
     except Exception as e:
@@ -505,8 +818,7 @@ async def get_group_by_id(
     """Get detailed information about a specific group."""
     logger.info(f"Getting group by ID: {group_id}")
     try:
-        with SessionLocal() as session:
-            group = Group.get_by_id(group_id, session)
+        group = await run_read_in_session(Group.get_by_id, group_id)
         if not group:
             return f"Group with ID {group_id} not found"
 
@@ -541,15 +853,13 @@ async def activate_user(
     """Activate a user by username (sets is_activated=True)."""
     logger.info(f"Activating user: {username}")
     try:
-        with SessionLocal() as session:
-            user = session.query(User).filter(User.username == username).first()
-            if not user:
-                return f"User with username '{username}' not found"
-            if user.is_activated:
-                return f"User '{username}' is already activated"
-            user.is_activated = True
-            session.commit()
-            return f"User '{username}' activated successfully"
+        changed = await run_in_session(User.set_activated, username, True)
+        user_cache.invalidate_username(username)
+        if changed is None:
+            return f"User with username '{username}' not found"
+        if not changed:
+            return f"User '{username}' is already activated"
+        return f"User '{username}' activated successfully"
     except Exception as e:
         logger.error(f"Error activating user: {e}")
         return f"Database error: {str(e)}"
@@ -562,20 +872,36 @@ async def deactivate_user(
     """Deactivate a user by username (sets is_activated=False)."""
     logger.info(f"Deactivating user: {username}")
     try:
-        with SessionLocal() as session:
-            user = session.query(User).filter(User.username == username).first()
-            if not user:
-                return f"User with username '{username}' not found"
-            if not user.is_activated:
-                return f"User '{username}' is already deactivated"
-            user.is_activated = False
-            session.commit()
-            return f"User '{username}' deactivated successfully"
+        changed = await run_in_session(User.set_activated, username, False)
+        user_cache.invalidate_username(username)
+        if changed is None:
+            return f"User with username '{username}' not found"
+        if not changed:
+            return f"User '{username}' is already deactivated"
+        return f"User '{username}' deactivated successfully"
     except Exception as e:
         logger.error(f"Error deactivating user: {e}")
         return f"Database error: {str(e)}"
 
 
+@mcp_server.tool(tags=["admin"])
+async def delete_users(
+    user_ids: Annotated[List[str], "User IDs of the users to delete"],
+) -> str:
+    """Delete users by user ID, with their group memberships."""
+    logger.info(f"Deleting {len(user_ids)} users")
+    try:
+        usernames = await run_in_session(User.delete_many, user_ids)
+    except Exception as e:
+        logger.error(f"Error deleting users: {e}")
+        return f"Database error: {str(e)}"
+    for user_id in user_ids:
+        user_cache.invalidate_user_id(user_id)
+    for username in filter(None, usernames):
+        user_cache.invalidate_username(username)
+    return f"Deleted {len(usernames)} users"
+
+
 @mcp_server.tool(enabled=False)
 async def get_group_by_name(
     name: Annotated[str, "Name of the group to retrieve"],
@@ -583,8 +909,7 @@ async def get_group_by_name(
     """Get detailed information about a group by its name."""
     logger.info(f"Getting group by name: {name}")
     try:
-        with SessionLocal() as session:
-            group = Group.get_by_name(name, session)
+        group = await run_read_in_session(Group.get_by_name, name)
         if not group:
             return f"Group with name '{name}' not found"
 
@@ -613,44 +938,64 @@ async def get_group_by_name(
 
 
 @mcp_server.tool(tags=["admin"])
-async def list_users() -> str:
-    """Get a list of all users in the database."""
-    logger.info("Getting all users")
+async def list_users(
+    limit: Annotated[
+        int, f"Maximum number of users to return, at most {MAX_PAGE_SIZE}"
+    ] = DEFAULT_PAGE_SIZE,
+    cursor: Annotated[
+        Optional[int], "Next cursor from the previous page, empty for the first page"
+    ] = None,
+) -> str:
+    """Get a list of users in the database, one page at a time."""
+    logger.info(f"Getting users, cursor: {cursor}")
     try:
-        with SessionLocal() as session:
-            users = User.get_all(session)
-
-            logger.info(f"Number of users: {len(users)}")
-
-            registry_users = []
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(
-                    f"{MCP_REGISTRY_ENDPOINT}/list_users",
+        limit = check_page_limit(limit)
+    except ValueError as e:
+        return str(e)
+    try:
+        # the DB session is closed as soon as the read is done,
+        # it is not held while waiting for the registry roles
+        started_at = time.perf_counter()
+        db_outcome, roles_outcome = await asyncio.gather(
+            timed(
+                run_read_in_session(
+                    User.get_all_brief, limit=limit + 1, after_id=cursor
                 )
-                if response.status_code != 200:
-                    return f"Error listing users: {response.text}"
-                response_users = response.json()
+            ),
+            # a no-op unless the role snapshot has expired
+            timed(role_cache.ensure_fresh()),
+            # let both finish so a failure does not leave the other one running
+            return_exceptions=True,
+        )
+        for outcome in (db_outcome, roles_outcome):
+            if isinstance(outcome, BaseException):
+                raise outcome
+        users, db_seconds = db_outcome
+        _, roles_seconds = roles_outcome
+        logger.debug(
+            f"list_users timings: db {db_seconds:.3f}s, "
+            f"roles {roles_seconds:.3f}s, "
+            f"total {time.perf_counter() - started_at:.3f}s"
+        )
+        users, next_cursor = split_page(users, limit)
 
-                registry_users = {
-                    record["user"]["user_id"]: {"role": record["user"]["role"]}
-                    for record in response_users.get("users", dict())
-                }
+        logger.info(f"Number of users: {len(users)}")
 
-                logger.info(f"Number of registry users: {len(registry_users)}")
+        roles = role_cache.get_roles(user["user_id"] for user in users)
 
-            result = [
-                {
-                    "user_id": user["user_id"],
-                    "username": user["username"],
-                    "activated": user.get("is_activated", False),
-                    "role": registry_users.get(user["user_id"], {}).get(
-                        "role", "(no role)"
-                    ),
-                }
-                for user in users
-            ]
+        result = [
+            {
+                "user_id": user["user_id"],
+                "username": user["username"],
+                "activated": user.get("is_activated", False),
+                "role": roles[user["user_id"]] or "(no role)",
+            }
+            for user in users
+        ]
 
-            return str(result)
+        return str(result) + format_next_cursor(next_cursor)
+    except RegistryError as e:
+        return f"Error listing users: {e}"
     except Exception as e:
         logger.error(f"Error listing users: {e}")
         return f"Database error: {str(e)}"
@@ -663,8 +1008,7 @@ async def get_user_by_user_id(
     """Get detailed information about a user by their user_id."""
     logger.info(f"Getting user by user_id: {user_id}")
     try:
-        with SessionLocal() as session:
-            user = User.get_by_user_id(user_id, session)
+        user = await run_read_in_session(User.get_by_user_id, user_id)
         if not user:
             return f"User with ID {user_id} not found"
 
@@ -702,14 +1046,52 @@ async def http_health_check(request):
     return JSONResponse({"status": "healthy", "service": "users-groups-mcp-server"})
 
 
-def main():
-    init_db(engine)
-    mcp_server.run(
-        transport="http",
-        host=MCP_HOST,
-        port=MCP_PORT,
+@mcp_server.custom_route("/metrics", methods=["GET"])
+async def http_metrics(request):
+    return JSONResponse(
+        {
+            "db_executor": blocking_executor.stats(),
+            "read_db_executor": read_executor.stats() if read_executor else None,
+            "db_pool": pool_stats(engine),
+            "async_db_pool": pool_stats(async_engine.sync_engine),
+            "user_cache": user_cache.stats(),
+            "role_cache": role_cache.stats(),
+            "username_pool": username_pool.stats(),
+            "username_index": username_index.stats(),
+        }
     )
 
 
+def load_username_index(session) -> None:
+    username_index.load(User.iter_usernames(session))
+
+
+async def serve() -> None:
+    if uses_blocking_executor():
+        init_db(engine)
+    else:
+        await init_async_db(async_engine)
+    await run_in_session(load_username_index)
+    await http_clients.start()
+    username_pool.start()
+    try:
+        await mcp_server.run_async(
+            transport="http",
+            host=MCP_HOST,
+            port=MCP_PORT,
+        )
+    finally:
+        await username_pool.stop()
+        await http_clients.close()
+        blocking_executor.shutdown()
+        if read_executor is not None:
+            read_executor.shutdown()
+        await async_engine.dispose()
+
+
+def main():
+    asyncio.run(serve())
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,54 @@
+"""Add and recompute the maintained `users_count` / `groups_count` columns.
+
+Run it after editing memberships outside the server, and once before
+starting the server on a database created before the counters existed
+(the missing columns are added first, then filled from the memberships):
+
+    uv run src/repair_counters.py
+"""
+
+import logging
+
+from sqlalchemy import inspect, text
+
+from storage import SessionLocal, engine, init_db
+from user_group_db.models import recount_memberships
+
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
+logger = logging.getLogger(__name__)
+
+# table -> maintained counter column
+COUNTER_COLUMNS = {"groups": "users_count", "users": "groups_count"}
+
+
+def add_counter_columns(engine) -> None:
+    """Add the counter columns missing in an existing database.
+
+    Safe to run repeatedly: columns that are already there are skipped.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, column in COUNTER_COLUMNS.items():
+            existing = {info["name"] for info in inspector.get_columns(table)}
+            if column in existing:
+                continue
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table} ADD COLUMN {column} INTEGER DEFAULT 0 NOT NULL"
+                )
+            )
+            logger.info(f"Added column {table}.{column}")
+
+
+def main():
+    init_db(engine)
+    add_counter_columns(engine)
+    with SessionLocal() as session:
+        recount_memberships(session)
+
+
+if __name__ == "__main__":
+    main()
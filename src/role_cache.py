@@ -0,0 +1,112 @@
+import asyncio
+import envs
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from http_clients import http_clients
+
+logger = logging.getLogger(__name__)
+
+
+class RegistryError(RuntimeError):
+    """Raised when the registry cannot be read."""
+
+
+async def fetch_registry_roles() -> Dict[str, str]:
+    """Download {user_id: role} for all users known to the registry."""
+    response = await http_clients.registry.get(
+        f"{envs.MCP_REGISTRY_ENDPOINT}/list_users",
+        timeout=30.0,
+    )
+    if response.status_code != 200:
+        raise RegistryError(response.text)
+    return {
+        record["user"]["user_id"]: record["user"]["role"]
+        for record in response.json().get("users", [])
+    }
+
+
+class RoleCache:
+    """Local copy of registry roles keyed by user_id.
+
+    Roles written by this service (e.g. `create_user`) are put in
+    directly, so readers do not download the whole registry on every call.
+    The snapshot is reloaded only when it is read after `ttl_seconds`, an
+    idle server does not poll the registry.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[Dict[str, str]]],
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._roles: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        # roles set while a download is in flight, None when there is none
+        self._pending: Optional[Dict[str, str]] = None
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def is_fresh(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and self._clock() - self._loaded_at < self.ttl_seconds
+        )
+
+    async def refresh(self, force: bool = True) -> None:
+        async with self._lock:
+            if not force and self.is_fresh():
+                # another caller has just reloaded it
+                return
+            self._pending = {}
+            try:
+                roles = await self._fetch()
+                # the download may predate roles set while it was in flight
+                self._roles = {**roles, **self._pending}
+            finally:
+                self._pending = None
+            self._loaded_at = self._clock()
+            self.refreshes += 1
+        logger.info(f"Role cache refreshed with {len(roles)} registry users")
+
+    async def ensure_fresh(self) -> None:
+        """Reload the snapshot if it has expired.
+
+        A stale snapshot is still served when the reload fails, an error is
+        raised only if nothing was loaded yet.
+        """
+        if self.is_fresh():
+            return
+        try:
+            await self.refresh(force=False)
+        except Exception as e:
+            self.refresh_errors += 1
+            if self._loaded_at is None:
+                raise
+            logger.warning(f"Using stale role cache, refresh failed: {e}")
+
+    def get_roles(self, user_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Return {user_id: role or None} from the local snapshot."""
+        return {user_id: self._roles.get(user_id) for user_id in user_ids}
+
+    def set_role(self, user_id: str, role: str) -> None:
+        self._roles[user_id] = role
+        if self._pending is not None:
+            self._pending[user_id] = role
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._roles),
+            "fresh": self.is_fresh(),
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+role_cache = RoleCache(fetch_registry_roles, envs.ROLE_CACHE_TTL_SECONDS)
@@ -1,9 +1,16 @@
+import asyncio
 import envs
 import logging
-from typing import Callable, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple, TypeVar
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +20,10 @@ class Base(DeclarativeBase):
 
 
 def build_database_url() -> str:
-    if envs.STORAGE_DB.startswith("sqlite"):
+    if envs.STORAGE_DB == "sqlite-prod":
+        logger.info(f"The `sqlite` is used as storage db: {envs.SQLITE_PATH}")
+        return f"sqlite:///{envs.SQLITE_PATH}"
+    elif envs.STORAGE_DB.startswith("sqlite"):
         if not envs.DEBUG_MODE:
             logger.warning(
                 "The `sqlite` is used as storage db! Use it ONLY for development"
@@ -30,20 +40,337 @@ def build_database_url() -> str:
         raise ValueError("The `STORAGE_DB` env variable is not correct")
 
 
+def build_async_database_url() -> str:
+    """Same database as `build_database_url`, but with an asyncio driver."""
+    database_url = build_database_url()
+    if database_url.startswith("sqlite"):
+        return database_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return database_url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record) -> None:
+    """SQLite enforces foreign keys (and so ON DELETE) only when asked to."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def tune_sqlite_connection(dbapi_connection, connection_record) -> None:
+    """Pragmas of the `sqlite-prod` storage."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={envs.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={envs.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def tune_sqlite_read_connection(dbapi_connection, connection_record) -> None:
+    """Pragmas of the `sqlite-prod` read-only connections."""
+    tune_sqlite_connection(dbapi_connection, connection_record)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+class PoolMetrics:
+    """Checkout statistics of a connection pool, see `metered_pool_class`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float, timed_out: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def stats(self, pool) -> dict:
+        with self._lock:
+            return {
+                "size": pool.size(),
+                "in_use": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_total,
+                "wait_seconds_max": self.wait_max,
+            }
+
+
+def metered_pool_class(pool_class: type) -> type:
+    """Return a subclass of `pool_class` timing every checkout wait.
+
+    The metrics live on the class, so they survive pool re-creation
+    (e.g. `engine.dispose()`).
+    """
+
+    class MeteredPool(pool_class):
+        metrics = PoolMetrics()
+
+        def _do_get(self):
+            started_at = time.perf_counter()
+            timed_out = False
+            try:
+                return super()._do_get()
+            except PoolTimeoutError:
+                timed_out = True
+                raise
+            finally:
+                self.metrics.record(time.perf_counter() - started_at, timed_out)
+
+    MeteredPool.__name__ = f"Metered{pool_class.__name__}"
+    return MeteredPool
+
+
+def get_pool_kwargs(pool_class: type) -> dict:
+    """Pool settings of the postgres engines, taken from `envs`."""
+    return {
+        "poolclass": metered_pool_class(pool_class),
+        "pool_size": envs.DB_POOL_SIZE,
+        "max_overflow": envs.DB_MAX_OVERFLOW,
+        "pool_timeout": envs.DB_POOL_TIMEOUT,
+        "pool_recycle": envs.DB_POOL_RECYCLE,
+        "pool_pre_ping": envs.DB_POOL_PRE_PING,
+    }
+
+
+def pool_stats(engine) -> Optional[dict]:
+    """Return checkout statistics of the engine pool, None if not metered."""
+    pool = engine.pool
+    metrics = getattr(pool, "metrics", None)
+    return metrics.stats(pool) if metrics is not None else None
+
+
+def uses_blocking_executor() -> bool:
+    """Return True if model calls run on `blocking_executor`.
+
+    `sqlite-prod` always does: its single worker owns the only connection,
+    so it is the one writer and concurrent calls queue up in the executor
+    instead of failing with `database is locked`. So does `sqlite-memory`:
+    the in-memory database lives on one shared connection, and concurrent
+    async sessions on it fail with `SQL statements in progress` (while
+    some of the writes reported as failed still get committed).
+    """
+    return envs.DB_EXECUTOR == "threadpool" or envs.STORAGE_DB in (
+        "sqlite-prod",
+        "sqlite-memory",
+    )
+
+
 def get_engine_and_sessionmaker() -> Tuple[object, sessionmaker]:
     database_url = build_database_url()
     connect_args = {}
+    engine_kwargs = {}
     if database_url.startswith("sqlite"):
         connect_args = {"check_same_thread": False}
-    engine = create_engine(database_url, echo=False, connect_args=connect_args)
+    if database_url == "sqlite:///:memory:":
+        # one shared connection, otherwise every worker thread
+        # gets its own empty in-memory database
+        engine_kwargs["poolclass"] = StaticPool
+    if envs.STORAGE_DB == "sqlite-prod":
+        # the single writer connection
+        engine_kwargs["pool_size"] = 1
+        engine_kwargs["max_overflow"] = 0
+    if database_url.startswith("postgresql"):
+        engine_kwargs.update(get_pool_kwargs(QueuePool))
+    engine = create_engine(
+        database_url, echo=False, connect_args=connect_args, **engine_kwargs
+    )
+    if envs.STORAGE_DB == "sqlite-prod":
+        event.listen(engine, "connect", tune_sqlite_connection)
+    elif database_url.startswith("sqlite"):
+        event.listen(engine, "connect", enable_sqlite_foreign_keys)
     SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
     return engine, SessionLocal
 
 
+def get_read_engine_and_sessionmaker() -> Tuple[
+    Optional[object], Optional[sessionmaker]
+]:
+    """Return the read-only engine of `sqlite-prod`, or (None, None).
+
+    With WAL its connections read concurrently with the single writer, so
+    reads do not wait in the writer's queue.
+    """
+    if envs.STORAGE_DB != "sqlite-prod" or envs.SQLITE_READ_POOL_SIZE <= 0:
+        return None, None
+    engine = create_engine(
+        build_database_url(),
+        echo=False,
+        connect_args={"check_same_thread": False},
+        pool_size=envs.SQLITE_READ_POOL_SIZE,
+        max_overflow=0,
+    )
+    event.listen(engine, "connect", tune_sqlite_read_connection)
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    return engine, SessionLocal
+
+
+def get_async_engine_and_sessionmaker() -> Tuple[AsyncEngine, async_sessionmaker]:
+    database_url = build_async_database_url()
+    engine_kwargs = {}
+    if database_url.startswith("postgresql"):
+        engine_kwargs.update(get_pool_kwargs(AsyncAdaptedQueuePool))
+    engine = create_async_engine(database_url, echo=False, **engine_kwargs)
+    if database_url.startswith("sqlite"):
+        event.listen(engine.sync_engine, "connect", enable_sqlite_foreign_keys)
+    AsyncSessionLocal = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+    return engine, AsyncSessionLocal
+
+
 def init_db(engine) -> None:
     Base.metadata.create_all(bind=engine)
 
 
+async def init_async_db(engine: AsyncEngine) -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+T = TypeVar("T")
+
+
+class ExecutorQueueFullError(RuntimeError):
+    """Raised when too many calls are already waiting for a worker."""
+
+
+class BlockingExecutor:
+    """Bounded thread pool running sync-session callables off the event loop.
+
+    Every call gets its own `Session` from `session_factory`. Time spent
+    waiting for a free worker and time spent running are tracked separately
+    to help sizing `DB_EXECUTOR_WORKERS` and `DB_EXECUTOR_MAX_QUEUE`.
+    """
+
+    def __init__(self, session_factory: sessionmaker, max_workers: int, max_queue: int):
+        self.session_factory = session_factory
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="db-executor"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._calls = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorQueueFullError(
+                    f"Database executor queue is full ({self.max_queue} calls waiting)"
+                )
+            self._queued += 1
+        submitted_at = time.perf_counter()
+
+        def _job() -> T:
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+            try:
+                with self.session_factory() as session:
+                    return fn(*args, session=session, **kwargs)
+            finally:
+                self._record(
+                    started_at - submitted_at, time.perf_counter() - started_at
+                )
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _job)
+
+    def _record(self, wait: float, run: float) -> None:
+        with self._lock:
+            self._calls += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._run_total += run
+            self._run_max = max(self._run_max, run)
+        logger.debug(f"DB executor call waited {wait:.4f}s, ran {run:.4f}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "calls": self._calls,
+                "rejected": self._rejected,
+                "wait_seconds_total": self._wait_total,
+                "wait_seconds_max": self._wait_max,
+                "run_seconds_total": self._run_total,
+                "run_seconds_max": self._run_max,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def get_read_executor(
+    ReadSessionLocal: Optional[sessionmaker],
+) -> Optional[BlockingExecutor]:
+    """One worker per read-only connection, or None without a read engine."""
+    if ReadSessionLocal is None:
+        return None
+    return BlockingExecutor(
+        ReadSessionLocal, envs.SQLITE_READ_POOL_SIZE, envs.DB_EXECUTOR_MAX_QUEUE
+    )
+
+
+def get_blocking_executor(engine, SessionLocal: sessionmaker) -> BlockingExecutor:
+    max_workers = envs.DB_EXECUTOR_WORKERS
+    if envs.STORAGE_DB in ("sqlite-prod", "sqlite-memory"):
+        # a single connection, so a single worker using it at a time
+        max_workers = 1
+    elif max_workers <= 0:
+        # more workers than connections would only wait on the pool
+        max_workers = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+    return BlockingExecutor(SessionLocal, max_workers, envs.DB_EXECUTOR_MAX_QUEUE)
+
+
+async def run_in_session(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run `fn(*args, session=..., **kwargs)` without blocking the event loop.
+
+    `fn` is a regular function working with a sync `Session` (e.g. the
+    `Group`/`User` classmethods). By default it is executed through
+    `AsyncSession.run_sync`, so every query goes through the asyncio driver
+    and awaits the database instead of blocking the loop thread. With
+    `DB_EXECUTOR=threadpool`, `STORAGE_DB=sqlite-prod` or
+    `STORAGE_DB=sqlite-memory` it runs on `blocking_executor` instead.
+    """
+    if uses_blocking_executor():
+        return await blocking_executor.run(fn, *args, **kwargs)
+    async with AsyncSessionLocal() as session:
+        return await session.run_sync(
+            lambda sync_session: fn(*args, session=sync_session, **kwargs)
+        )
+
+
+async def run_read_in_session(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Same as `run_in_session` for `fn` that only reads.
+
+    With `STORAGE_DB=sqlite-prod` it runs on `read_executor`, so reads are
+    served by the read-only connections instead of queueing up behind the
+    writes on the single writer.
+    """
+    if read_executor is not None:
+        return await read_executor.run(fn, *args, **kwargs)
+    return await run_in_session(fn, *args, **kwargs)
+
+
 def get_db_session(SessionLocal: sessionmaker) -> Callable:
     def _get_db():
         db = SessionLocal()
@@ -58,3 +385,8 @@ def get_db_session(SessionLocal: sessionmaker) -> Callable:
 engine, SessionLocal = get_engine_and_sessionmaker()
 init_db(engine)
 get_db = get_db_session(SessionLocal)
+
+async_engine, AsyncSessionLocal = get_async_engine_and_sessionmaker()
+blocking_executor = get_blocking_executor(engine, SessionLocal)
+read_engine, ReadSessionLocal = get_read_engine_and_sessionmaker()
+read_executor = get_read_executor(ReadSessionLocal)
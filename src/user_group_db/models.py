@@ -4,29 +4,135 @@ from sqlalchemy import (
     String,
     DateTime,
     ForeignKey,
+    Index,
     Table,
     Text,
     Boolean,
+    delete,
+    event,
+    exists,
+    insert,
+    literal,
+    select,
+    update,
 )
-from typing import List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 import logging
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.sql import func
 
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import aliased, backref, relationship
 
 from storage import Base
+from username_index import username_index
 
 logger = logging.getLogger(__name__)
 
+
+def paginate(query, id_column, limit: Optional[int], after_id: Optional[int]):
+    """Apply keyset pagination by `id_column` to the query.
+
+    `after_id` is the last id of the previous page, so every page is an
+    index range scan no matter how deep it is.
+    """
+    query = query.order_by(id_column)
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
 # Many-to-many association table between groups and users
 group_user_association = Table(
     "group_user_association",
     Base.metadata,
-    Column("group_id", Integer, ForeignKey("groups.id"), primary_key=True),
-    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column(
+        "group_id",
+        Integer,
+        ForeignKey("groups.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    # the primary key serves lookups by group, this one lookups by user
+    Index("ix_group_user_association_user_id_group_id", "user_id", "group_id"),
 )
 
 
+def count_memberships(session, group_id: int, user_ids, delta: int, **values) -> None:
+    """Move the member counters after the users joined (+1) or left (-1)
+    the group.
+
+    `values` are set on the users by the same UPDATE. Does not commit, so
+    the counters change in the transaction of the membership change.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    session.execute(
+        update(Group)
+        .where(Group.id == group_id)
+        .values(users_count=Group.users_count + delta * len(user_ids))
+    )
+    session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(groups_count=User.groups_count + delta, **values)
+    )
+
+
+def insert_memberships(session, group_id: int, user_ids) -> Set[int]:
+    """Add the users to the group and return the user ids (User.id) that
+    were not members yet.
+
+    It is one conflict-ignoring insert, so concurrent adds of the same user
+    neither fail nor get counted twice. Does not commit.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return set()
+    if session.get_bind().dialect.name == "postgresql":
+        dialect_insert = postgresql_insert
+    else:
+        dialect_insert = sqlite_insert
+    query = (
+        dialect_insert(group_user_association)
+        .values([{"group_id": group_id, "user_id": user_id} for user_id in user_ids])
+        .on_conflict_do_nothing()
+        .returning(group_user_association.c.user_id)
+    )
+    return set(session.execute(query).scalars())
+
+
+def recount_memberships(session) -> None:
+    """Recompute `users_count` and `groups_count` of all rows from
+    `group_user_association`, with one UPDATE per table.
+    """
+    association = group_user_association.c
+    session.execute(
+        update(Group).values(
+            users_count=select(func.count())
+            .where(association.group_id == Group.id)
+            .scalar_subquery()
+        )
+    )
+    session.execute(
+        update(User).values(
+            groups_count=select(func.count())
+            .where(association.user_id == User.id)
+            .scalar_subquery()
+        )
+    )
+    session.commit()
+    logger.info("Membership counters recomputed")
+
+
 class Group(Base):
     """Group model"""
 
@@ -35,17 +141,29 @@ class Group(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False, index=True)
     description = Column(Text, nullable=True)
-    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    owner_id = Column(
+        Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True
+    )
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # number of members, maintained by every membership change
+    users_count = Column(Integer, nullable=False, default=0, server_default="0")
 
-    # Relationship with users through association table
+    # Relationship with users through association table,
+    # memberships are removed by the delete methods, never loaded for it
     users = relationship(
-        "User", secondary=group_user_association, back_populates="groups"
+        "User",
+        secondary=group_user_association,
+        back_populates="groups",
+        passive_deletes=True,
     )
 
     # Relationship with owner
-    owner = relationship("User", foreign_keys=[owner_id], backref="owned_groups")
+    owner = relationship(
+        "User",
+        foreign_keys=[owner_id],
+        backref=backref("owned_groups", passive_deletes=True),
+    )
 
     def __repr__(self):
         return f"<Group(id={self.id}, name='{self.name}')>"
@@ -59,9 +177,12 @@ class Group(Base):
         description: Optional[str] = None,
         owner_user_id: Optional[str] = None,
     ) -> dict:
-        """Create a group and optionally attach users by their telegram IDs.
+        """Create a group and optionally attach users by their usernames.
 
-        Returns a dict mirroring previous GroupDatabase.create_group output.
+        Usernames are resolved with one query, attached with one multi-row
+        insert and activated (and counted) with one UPDATE. Returns a dict mirroring
+        previous GroupDatabase.create_group output, plus the list of
+        `not_found_usernames`.
         """
         # Check existing
         existing_group = session.query(cls).filter(cls.name == name).first()
@@ -81,16 +202,17 @@ class Group(Base):
         session.add(group)
         session.flush()
 
-        users_count = 0
-        if usernames:
-            for username in usernames:
-                user = session.query(User).filter(User.username == username).first()
-                if user:
-                    group.users.append(user)
-                    user.is_activated = True
-                    users_count += 1
-                else:
-                    logger.warning(f"User with username {username} not found")
+        found, not_found_usernames = User.resolve_usernames(usernames or [], session)
+        if not_found_usernames:
+            logger.warning(f"Users with usernames {not_found_usernames} not found")
+
+        if found:
+            user_ids = list(found.values())
+            session.execute(
+                insert(group_user_association),
+                [{"group_id": group.id, "user_id": user_id} for user_id in user_ids],
+            )
+            count_memberships(session, group.id, user_ids, +1, is_activated=True)
 
         session.commit()
 
@@ -99,98 +221,304 @@ class Group(Base):
             "id": group.id,
             "name": group.name,
             "description": group.description,
-            "added_users_count": users_count,
+            "added_users_count": len(found),
+            "not_found_usernames": not_found_usernames,
             "created_at": group.created_at,
         }
 
     @classmethod
     def delete_by_id(cls, group_id: int, session) -> bool:
-        """Delete group by ID. Returns True if deleted, False if not found."""
-        group = session.query(cls).filter(cls.id == group_id).first()
-        if not group:
+        """Delete group by ID. Returns True if deleted, False if not found.
+
+        The members lose one group in their counters with one UPDATE, and
+        the memberships are removed with one DELETE. The DB would cascade it,
+        but databases created before ON DELETE CASCADE do not.
+        """
+        association = group_user_association.c
+        session.execute(
+            update(User)
+            .where(
+                User.id.in_(
+                    select(association.user_id).where(association.group_id == group_id)
+                )
+            )
+            .values(groups_count=User.groups_count - 1)
+        )
+        session.execute(
+            delete(group_user_association).where(association.group_id == group_id)
+        )
+        deleted = session.execute(delete(cls).where(cls.id == group_id)).rowcount
+        session.commit()
+        if not deleted:
             logger.warning(f"Group with ID {group_id} not found")
             return False
-        session.delete(group)
-        session.commit()
-        logger.info(f"Group '{group.name}' deleted successfully")
+        logger.info(f"Group with ID {group_id} deleted successfully")
         return True
 
     @classmethod
     def add_user(cls, group_id: int, username: str, session) -> bool:
-        """Add a user (by user_id) to the group. Returns True on success."""
-        group = session.query(cls).filter(cls.id == group_id).first()
-        if not group:
+        """Add a user (by username) to the group. Returns True on success."""
+        if session.query(cls.id).filter(cls.id == group_id).first() is None:
             logger.warning(f"Group with ID {group_id} not found")
             return False
 
-        user = session.query(User).filter(User.username == username).first()
-        if not user:
+        user_id = session.query(User.id).filter(User.username == username).scalar()
+        if user_id is None:
             logger.warning(f"User with username {username} not found")
             return False
 
-        if user in group.users:
-            logger.info(f"User {username} is already in group '{group.name}'")
+        if not insert_memberships(session, group_id, [user_id]):
+            logger.info(f"User {username} is already in group {group_id}")
             return True
 
-        group.users.append(user)
+        count_memberships(session, group_id, [user_id], +1)
         session.commit()
-        logger.info(f"User {username} added to group '{group.name}'")
+        logger.info(f"User {username} added to group {group_id}")
         return True
 
     @classmethod
     def remove_user(cls, group_id: int, username: str, session) -> bool:
-        """Remove a user (by user_id) from the group. Returns True on success."""
-        group = session.query(cls).filter(cls.id == group_id).first()
-        if not group:
+        """Remove a user (by username) from the group. Returns True on success."""
+        if session.query(cls.id).filter(cls.id == group_id).first() is None:
             logger.warning(f"Group with ID {group_id} not found")
             return False
 
-        user = session.query(User).filter(User.username == username).first()
-        if not user:
+        user_id = session.query(User.id).filter(User.username == username).scalar()
+        if user_id is None:
             logger.warning(f"User with username {username} not found")
             return False
 
-        if user not in group.users:
-            logger.warning(f"User {username} is not in group '{group.name}'")
+        removed = session.execute(
+            delete(group_user_association).where(
+                group_user_association.c.group_id == group_id,
+                group_user_association.c.user_id == user_id,
+            )
+        ).rowcount
+        if removed:
+            count_memberships(session, group_id, [user_id], -1)
+        session.commit()
+        if not removed:
+            logger.warning(f"User {username} is not in group {group_id}")
             return False
+        logger.info(f"User {username} removed from group {group_id}")
+        return True
+
+    @classmethod
+    def add_users(cls, group_id: int, usernames: List[str], session) -> dict:
+        """Add users to the group and activate them, with a single commit.
+
+        Usernames are resolved with one query, memberships are added with
+        one conflict-ignoring multi-row insert, and users are activated with
+        one UPDATE for the new and one for the existing members.
+        Returns lists of `added`, `already_in_group` and `not_found`
+        usernames, or None if the group does not exist.
+        """
+        if session.query(cls.id).filter(cls.id == group_id).first() is None:
+            logger.warning(f"Group with ID {group_id} not found")
+            return None
+
+        found, not_found = User.resolve_usernames(usernames, session)
+        added_ids = insert_memberships(session, group_id, found.values())
+        added = [u for u, user_id in found.items() if user_id in added_ids]
+        members = set(found.values()) - added_ids
+        count_memberships(session, group_id, added_ids, +1, is_activated=True)
+        if members:
+            session.execute(
+                update(User).where(User.id.in_(members)).values(is_activated=True)
+            )
+        session.commit()
+        logger.info(f"Added {len(added)} users to group {group_id}")
+        return {
+            "added": added,
+            "already_in_group": [u for u in found if u not in added],
+            "not_found": not_found,
+        }
+
+    @classmethod
+    def remove_users(cls, group_id: int, usernames: List[str], session) -> dict:
+        """Remove users from the group, with a single commit.
+
+        Memberships are removed with one DELETE, and removed users left
+        without any group are deactivated with one UPDATE (the owner of the
+        group is never deactivated). Returns lists of `removed`,
+        `not_in_group` and `not_found` usernames, or None if the group does
+        not exist.
+        """
+        group = session.query(cls.id, cls.owner_id).filter(cls.id == group_id).first()
+        if group is None:
+            logger.warning(f"Group with ID {group_id} not found")
+            return None
+
+        found, not_found = User.resolve_usernames(usernames, session)
+        removed_ids = set()
+        if found:
+            removed_ids = set(
+                session.execute(
+                    delete(group_user_association)
+                    .where(group_user_association.c.group_id == group_id)
+                    .where(group_user_association.c.user_id.in_(found.values()))
+                    .returning(group_user_association.c.user_id)
+                ).scalars()
+            )
+        if removed_ids:
+            count_memberships(session, group_id, removed_ids, -1)
+            User.deactivate_without_groups(removed_ids, session, keep_id=group.owner_id)
+        session.commit()
+        removed = [u for u, user_id in found.items() if user_id in removed_ids]
+        logger.info(f"Removed {len(removed)} users from group {group_id}")
+        return {
+            "removed": removed,
+            "not_in_group": [u for u in found if u not in removed],
+            "not_found": not_found,
+        }
+
+    @classmethod
+    def sync_roster(cls, group_id: int, usernames: List[str], session) -> dict:
+        """Make the members of the group exactly the given usernames.
 
-        group.users.remove(user)
+        The difference to the current members is computed by the DB: one
+        DELETE of members not in the roster and one INSERT ... SELECT of
+        roster users that are not members yet, in a single transaction.
+        Only the users that were added or removed get their activation
+        updated. Returns lists of `added`, `removed` and `not_found`
+        usernames, or None if the group does not exist.
+        """
+        group = session.query(cls.id, cls.owner_id).filter(cls.id == group_id).first()
+        if group is None:
+            logger.warning(f"Group with ID {group_id} not found")
+            return None
+
+        found, not_found = User.resolve_usernames(usernames, session)
+        association = group_user_association.c
+        removed_ids = set(
+            session.execute(
+                delete(group_user_association)
+                .where(association.group_id == group_id)
+                .where(association.user_id.not_in(found.values()))
+                .returning(association.user_id)
+            ).scalars()
+        )
+        added_ids = set()
+        if found:
+            new_members = select(literal(group_id), User.id).where(
+                User.id.in_(found.values()),
+                ~exists().where(
+                    association.group_id == group_id, association.user_id == User.id
+                ),
+            )
+            added_ids = set(
+                session.execute(
+                    insert(group_user_association)
+                    .from_select(["group_id", "user_id"], new_members)
+                    .returning(association.user_id)
+                ).scalars()
+            )
+        count_memberships(session, group_id, added_ids, +1, is_activated=True)
+        removed = []
+        if removed_ids:
+            count_memberships(session, group_id, removed_ids, -1)
+            User.deactivate_without_groups(removed_ids, session, keep_id=group.owner_id)
+            removed = sorted(
+                session.execute(
+                    select(User.username).where(User.id.in_(removed_ids))
+                ).scalars()
+            )
         session.commit()
-        logger.info(f"User {username} removed from group '{group.name}'")
+        logger.info(
+            f"Synced group {group_id}: "
+            f"{len(added_ids)} added, {len(removed_ids)} removed"
+        )
+        return {
+            "added": [u for u, user_id in found.items() if user_id in added_ids],
+            "removed": removed,
+            "not_found": not_found,
+        }
+
+    @classmethod
+    def is_owned_by(cls, group_id: int, owner_user_id: str, session) -> bool:
+        """Return True if the group exists and is owned by `owner_user_id`."""
+        group = session.query(cls).filter(cls.id == group_id).first()
+        if not group:
+            logger.error(f"Group with ID {group_id} not found")
+            return False
+        if not group.owner or group.owner.user_id != owner_user_id:
+            logger.error(f"Group with ID {group_id} is not owned by {owner_user_id}")
+            return False
         return True
 
     @classmethod
-    def get_groups(cls, session, owner_user_id: Optional[str] = None) -> List[dict]:
-        """Return list of all groups as dicts with users_count."""
-        if owner_user_id:
-            groups = (
-                session.query(cls)
-                .join(cls.owner)
-                .filter(User.user_id == owner_user_id)
-                .all()
+    def get_students(
+        cls,
+        group_id: int,
+        session,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[dict]:
+        """Return activated members of the group as dicts, ordered by id."""
+        query = (
+            session.query(User.id, User.username, User.user_id)
+            .join(
+                group_user_association,
+                group_user_association.c.user_id == User.id,
             )
-        else:
-            groups = session.query(cls).all()
+            .filter(group_user_association.c.group_id == group_id)
+            .filter(User.is_activated)
+        )
+        # ordered by the association column, so pages follow its primary key
+        query = paginate(query, group_user_association.c.user_id, limit, after_id)
+        return [row._asdict() for row in query]
+
+    @classmethod
+    def get_groups(
+        cls,
+        session,
+        owner_user_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[dict]:
+        """Return list of all groups as dicts with users_count.
+
+        Owner comes from an outer join and members count is the maintained
+        `users_count` column, so the number of queries does not depend on
+        the number of groups.
+        """
+        owner = aliased(User)
+        query = session.query(
+            cls.id,
+            cls.name,
+            cls.description,
+            cls.owner_id,
+            cls.created_at,
+            cls.updated_at,
+            owner.user_id.label("owner_user_id"),
+            owner.username.label("owner_username"),
+            cls.users_count,
+        ).outerjoin(owner, cls.owner_id == owner.id)
+
+        if owner_user_id:
+            query = query.filter(owner.user_id == owner_user_id)
+        query = paginate(query, cls.id, limit, after_id)
+
         result: List[dict] = []
-        for group in groups:
+        for row in query:
             owner_info = None
-            if group.owner:
+            if row.owner_id is not None:
                 owner_info = {
-                    "user_id": group.owner.user_id,
-                    "username": group.owner.username,
+                    "user_id": row.owner_user_id,
+                    "username": row.owner_username,
                 }
             result.append(
                 {
-                    "id": group.id,
-                    "name": group.name,
-                    "description": group.description,
+                    "id": row.id,
+                    "name": row.name,
+                    "description": row.description,
                     "owner": owner_info,
-                    "created_at": group.created_at,
-                    "updated_at": group.updated_at,
-                    "users_count": len(group.users),
+                    "created_at": row.created_at,
+                    "updated_at": row.updated_at,
+                    "users_count": row.users_count,
                 }
             )
-        logger.info(f"Retrieved {len(groups)} groups")
+        logger.info(f"Retrieved {len(result)} groups")
         return result
 
     @classmethod
@@ -223,7 +551,7 @@ class Group(Base):
             "description": group.description,
             "owner": owner_info,
             "users": users,
-            "users_count": len(users),
+            "users_count": group.users_count,
             "created_at": group.created_at,
             "updated_at": group.updated_at,
         }
@@ -258,7 +586,7 @@ class Group(Base):
             "description": group.description,
             "owner": owner_info,
             "users": users,
-            "users_count": len(users),
+            "users_count": group.users_count,
             "created_at": group.created_at,
             "updated_at": group.updated_at,
         }
@@ -277,10 +605,15 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_activated = Column(Boolean, nullable=False, default=False)
+    # number of groups the user is in, maintained by every membership change
+    groups_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     # Relationship with groups through association table
     groups = relationship(
-        "Group", secondary=group_user_association, back_populates="users"
+        "Group",
+        secondary=group_user_association,
+        back_populates="users",
+        passive_deletes=True,
     )
 
     def __repr__(self):
@@ -316,27 +649,354 @@ class User(Base):
         return user
 
     @classmethod
-    def get_all(cls, session) -> List[dict]:
-        """Return list of all users as dicts with groups_count."""
-        users = session.query(cls).all()
-        result: List[dict] = []
-        for user in users:
-            result.append(
+    def create_many(
+        cls, users: List[dict], session, group_id: Optional[int] = None
+    ) -> List[dict]:
+        """Create users with one multi-row INSERT and a single commit.
+
+        `users` are dicts with `user_id` and `username`. If `group_id` is
+        given, the users are activated and added to the group in the same
+        transaction. Returns id, user_id and username of created users.
+        """
+        if not users:
+            return []
+        rows = session.execute(
+            insert(cls).returning(cls.id, cls.user_id, cls.username),
+            [
                 {
-                    "id": user.id,
-                    "user_id": user.user_id,
-                    "username": user.username,
-                    "first_name": user.first_name,
-                    "last_name": user.last_name,
-                    "is_activated": user.is_activated,
-                    "created_at": user.created_at,
-                    "updated_at": user.updated_at,
-                    "groups_count": len(user.groups),
+                    "user_id": user.get("user_id"),
+                    "username": user.get("username"),
+                    "is_activated": group_id is not None,
+                    "groups_count": int(group_id is not None),
                 }
+                for user in users
+            ],
+        ).all()
+        if group_id is not None:
+            session.execute(
+                insert(group_user_association),
+                [{"group_id": group_id, "user_id": row.id} for row in rows],
+            )
+            session.execute(
+                update(Group)
+                .where(Group.id == group_id)
+                .values(users_count=Group.users_count + len(rows))
+            )
+        session.commit()
+        # bulk inserts bypass the mapper events
+        for row in rows:
+            username_index.add(row.username)
+        logger.info(f"Created {len(rows)} users")
+        return [row._asdict() for row in rows]
+
+    @classmethod
+    def delete_many(cls, user_ids: List[str], session) -> List[str]:
+        """Delete users by user_id with one DELETE.
+
+        `users_count` of their groups is decreased with one UPDATE, then the
+        memberships are removed and owned groups lose their owner with one
+        statement each. The DB would do both (ON DELETE CASCADE / SET NULL),
+        but databases created before those rules do not. Returns usernames
+        of the deleted users (None for users without one).
+        """
+        if not user_ids:
+            return []
+        association = group_user_association.c
+        deleted_ids = select(cls.id).where(cls.user_id.in_(set(user_ids)))
+        lost_members = (
+            select(func.count())
+            .where(association.group_id == Group.id)
+            .where(association.user_id.in_(deleted_ids))
+            .scalar_subquery()
+        )
+        session.execute(
+            update(Group)
+            .where(
+                Group.id.in_(
+                    select(association.group_id).where(
+                        association.user_id.in_(deleted_ids)
+                    )
+                )
+            )
+            .values(users_count=Group.users_count - lost_members)
+        )
+        session.execute(
+            delete(group_user_association).where(association.user_id.in_(deleted_ids))
+        )
+        session.execute(
+            update(Group).where(Group.owner_id.in_(deleted_ids)).values(owner_id=None)
+        )
+        query = delete(cls).where(cls.user_id.in_(set(user_ids)))
+        usernames = session.execute(query.returning(cls.username)).scalars().all()
+        session.commit()
+        logger.info(f"Deleted {len(usernames)} users")
+        return usernames
+
+    @classmethod
+    def get_lookup(cls, user_id: str, session) -> Optional[dict]:
+        """Return `{"username", "is_activated"}` for the user_id, or None."""
+        row = (
+            session.query(cls.username, cls.is_activated)
+            .filter(cls.user_id == user_id)
+            .first()
+        )
+        if row is None:
+            return None
+        return {"username": row.username, "is_activated": row.is_activated}
+
+    @classmethod
+    def get_user_id_by_username(cls, username: str, session) -> Optional[str]:
+        """Return user_id for the username, or None."""
+        return session.query(cls.user_id).filter(cls.username == username).scalar()
+
+    @classmethod
+    def username_exists(cls, username: str, session) -> bool:
+        """Return True if a user with the username exists."""
+        if not username_index.might_exist(username):
+            return False
+        return (
+            session.query(cls.id).filter(cls.username == username).first() is not None
+        )
+
+    @classmethod
+    def get_usernames_by_user_ids(
+        cls, user_ids: List[str], session
+    ) -> Dict[str, Optional[str]]:
+        """Return {user_id: username or None} for all user_ids in one query."""
+        if not user_ids:
+            return {}
+        rows = session.query(cls.user_id, cls.username).filter(
+            cls.user_id.in_(set(user_ids))
+        )
+        found = dict(rows.all())
+        return {user_id: found.get(user_id) for user_id in user_ids}
+
+    @classmethod
+    def get_user_ids_by_usernames(
+        cls, usernames: List[str], session
+    ) -> Dict[str, Optional[str]]:
+        """Return {username: user_id or None} for all usernames in one query."""
+        if not usernames:
+            return {}
+        rows = session.query(cls.username, cls.user_id).filter(
+            cls.username.in_(set(usernames))
+        )
+        found = dict(rows.all())
+        return {username: found.get(username) for username in usernames}
+
+    @classmethod
+    def resolve_usernames(
+        cls, usernames: List[str], session
+    ) -> Tuple[Dict[str, int], List[str]]:
+        """Resolve usernames to ids (User.id) in one query.
+
+        Returns `({username: id}, not_found_usernames)`, both in the order
+        of `usernames` and without duplicates. The membership changes act on
+        the result, so it always asks the DB: the in-memory username index
+        misses users created by other processes.
+        """
+        wanted = list(dict.fromkeys(usernames))
+        rows = {}
+        if wanted:
+            rows = dict(
+                session.query(cls.username, cls.id).filter(cls.username.in_(wanted))
+            )
+        found = {u: rows[u] for u in wanted if u in rows}
+        return found, [u for u in wanted if u not in rows]
+
+    @classmethod
+    def count_groups(cls, id: int, session) -> int:
+        """Return number of groups the user (by User.id) is in.
+
+        It reads the maintained `groups_count` column.
+        """
+        return session.execute(select(cls.groups_count).where(cls.id == id)).scalar()
+
+    @classmethod
+    def deactivate_without_groups(
+        cls, ids, session, keep_id: Optional[int] = None
+    ) -> None:
+        """Deactivate users (by User.id) that are not in any group anymore.
+
+        It is a single UPDATE and does not commit.
+        """
+        query = update(cls).where(cls.id.in_(set(ids))).where(cls.groups_count == 0)
+        if keep_id is not None:
+            query = query.where(cls.id != keep_id)
+        session.execute(query.values(is_activated=False))
+
+    @classmethod
+    def deactivate_last_group_members(
+        cls, group_id: int, session, keep_id: Optional[int] = None
+    ) -> int:
+        """Deactivate members whose only group is `group_id`.
+
+        It is a single UPDATE and does not commit. Returns number of
+        deactivated users.
+        """
+        association = group_user_association.c
+        query = (
+            update(cls)
+            .where(
+                cls.id.in_(
+                    select(association.user_id).where(association.group_id == group_id)
+                )
+            )
+            .where(cls.groups_count == 1)
+            .where(cls.is_activated)
+        )
+        if keep_id is not None:
+            query = query.where(cls.id != keep_id)
+        return session.execute(query.values(is_activated=False)).rowcount
+
+    @classmethod
+    def get_existing_user_ids(cls, user_ids: List[str], session) -> Set[str]:
+        """Return the subset of user_ids that exist, in one query."""
+        if not user_ids:
+            return set()
+        rows = session.query(cls.user_id).filter(cls.user_id.in_(set(user_ids)))
+        return {user_id for (user_id,) in rows}
+
+    @classmethod
+    def get_existing_usernames(cls, usernames: List[str], session) -> Set[str]:
+        """Return the subset of usernames that exist, in one query.
+
+        Usernames the in-memory index knows to be free are not queried.
+        """
+        candidates = {u for u in usernames if username_index.might_exist(u)}
+        if not candidates:
+            return set()
+        rows = session.query(cls.username).filter(cls.username.in_(candidates))
+        return {username for (username,) in rows}
+
+    @classmethod
+    def get_unavailable_usernames(cls, usernames: List[str], session) -> Set[str]:
+        """Return the subset of usernames that are taken or reserved in the
+        username pool, so must not be given to a new user. It is one query.
+        """
+        candidates = set(usernames)
+        if not candidates:
+            return set()
+        query = select(ReservedUsername.username).where(
+            ReservedUsername.username.in_(candidates)
+        )
+        # usernames the in-memory index knows to be free are not queried
+        maybe_taken = {u for u in candidates if username_index.might_exist(u)}
+        if maybe_taken:
+            query = query.union(
+                select(cls.username).where(cls.username.in_(maybe_taken))
             )
-        logger.info(f"Retrieved {len(users)} users")
+        return set(session.execute(query).scalars())
+
+    @classmethod
+    def pick_free_username(cls, candidates: List[str], session) -> Optional[str]:
+        """Return the first candidate neither taken nor reserved, or None.
+
+        All candidates are checked with a single query.
+        """
+        unavailable = cls.get_unavailable_usernames(candidates, session)
+        for candidate in candidates:
+            if candidate not in unavailable:
+                return candidate
+        return None
+
+    @classmethod
+    def get_activated_by_user_ids(cls, user_ids: List[str], session) -> Dict[str, bool]:
+        """Return {user_id: is_activated} for all user_ids in one query.
+
+        Unknown user_ids are reported as not activated.
+        """
+        if not user_ids:
+            return {}
+        rows = session.query(cls.user_id, cls.is_activated).filter(
+            cls.user_id.in_(set(user_ids))
+        )
+        found = dict(rows.all())
+        return {user_id: bool(found.get(user_id)) for user_id in user_ids}
+
+    @classmethod
+    def set_user_id(cls, username: str, user_id: str, session) -> bool:
+        """Set user_id for the username. Returns False if user not found."""
+        user = session.query(cls).filter(cls.username == username).first()
+        if not user:
+            logger.warning(f"User with username {username} not found")
+            return False
+        user.user_id = user_id
+        session.commit()
+        logger.info(f"User: {user}")
+        return True
+
+    @classmethod
+    def set_activated(
+        cls, username: str, is_activated: bool, session
+    ) -> Optional[bool]:
+        """Set is_activated for the username.
+
+        Returns None if user not found, False if it already had this state,
+        True if the state was changed.
+        """
+        user = session.query(cls).filter(cls.username == username).first()
+        if not user:
+            return None
+        if user.is_activated == is_activated:
+            return False
+        user.is_activated = is_activated
+        session.commit()
+        return True
+
+    @classmethod
+    def get_all(
+        cls,
+        session,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[dict]:
+        """Return list of all users as dicts with groups_count.
+
+        Columns (including the maintained `groups_count`) are selected
+        directly, so no `User` objects are built and the number of queries
+        does not depend on the number of users.
+        """
+        query = session.query(
+            cls.id,
+            cls.user_id,
+            cls.username,
+            cls.first_name,
+            cls.last_name,
+            cls.is_activated,
+            cls.created_at,
+            cls.updated_at,
+            cls.groups_count,
+        )
+        query = paginate(query, cls.id, limit, after_id)
+        result = [row._asdict() for row in query]
+        logger.info(f"Retrieved {len(result)} users")
         return result
 
+    @classmethod
+    def get_all_brief(
+        cls,
+        session,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+    ) -> List[dict]:
+        """Return id, user_id, username and is_activated of all users.
+
+        Only the columns `list_users` needs are fetched.
+        """
+        query = session.query(cls.id, cls.user_id, cls.username, cls.is_activated)
+        query = paginate(query, cls.id, limit, after_id)
+        result = [row._asdict() for row in query]
+        logger.info(f"Retrieved {len(result)} users")
+        return result
+
+    @classmethod
+    def iter_usernames(cls, session, batch_size: int = 5000):
+        """Yield all usernames, streaming them in batches of `batch_size`."""
+        query = select(cls.username).where(cls.username.is_not(None))
+        query = query.execution_options(yield_per=batch_size)
+        yield from session.execute(query).scalars()
+
     @classmethod
     def get_by_user_id(cls, user_id: str, session) -> Optional[dict]:
         """Return user by user_id as dict with groups list, or None."""
@@ -361,5 +1021,97 @@ class User(Base):
             "created_at": user.created_at,
             "updated_at": user.updated_at,
             "groups": groups,
-            "groups_count": len(groups),
+            "groups_count": user.groups_count,
         }
+
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+def _add_to_username_index(mapper, connection, user):
+    """Keep the in-memory username index in sync with ORM writes.
+
+    Bulk `insert(User)` statements bypass this and have to call
+    `username_index.add` themselves.
+    """
+    if user.username:
+        username_index.add(user.username)
+
+
+class ReservedUsername(Base):
+    """Pre-generated username that is not taken by any user yet"""
+
+    __tablename__ = "username_pool"
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(255), unique=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<ReservedUsername(id={self.id}, username='{self.username}')>"
+
+    @classmethod
+    def _pop_oldest(cls, count: int, session) -> List[str]:
+        """Remove up to `count` oldest reserved usernames and return them.
+
+        It is a single `DELETE ... RETURNING` statement. On Postgres the rows
+        are picked with `FOR UPDATE SKIP LOCKED`, so concurrent callers pick
+        different rows instead of all computing the same oldest ones.
+        """
+        oldest = (
+            select(cls.id)
+            .order_by(cls.id)
+            .limit(count)
+            .with_for_update(skip_locked=True)
+        )
+        query = delete(cls).where(cls.id.in_(oldest)).returning(cls.username)
+        return session.execute(query).scalars().all()
+
+    @classmethod
+    def take(cls, session) -> Optional[str]:
+        """Remove the oldest reserved username and return it, or None.
+
+        Reserved usernames a user got meanwhile are dropped and skipped.
+        """
+        usernames = cls.take_many(1, session)
+        return usernames[0] if usernames else None
+
+    @classmethod
+    def take_many(cls, count: int, session) -> List[str]:
+        """Remove up to `count` oldest reserved usernames and return them.
+
+        Reserved usernames a user got meanwhile are dropped and skipped.
+        """
+        usernames: List[str] = []
+        while len(usernames) < count:
+            taken = cls._pop_oldest(count - len(usernames), session)
+            if not taken:
+                break
+            existing = User.get_existing_usernames(taken, session)
+            if existing:
+                logger.warning(f"Dropped reserved usernames already taken: {existing}")
+            usernames += [username for username in taken if username not in existing]
+        session.commit()
+        return usernames
+
+    @classmethod
+    def count(cls, session) -> int:
+        """Return number of reserved usernames."""
+        return session.query(func.count(cls.id)).scalar()
+
+    @classmethod
+    def add_many(cls, usernames: List[str], session) -> int:
+        """Reserve the usernames that are neither taken nor reserved yet.
+
+        Returns number of added usernames.
+        """
+        candidates = set(usernames)
+        if not candidates:
+            return 0
+        free = candidates - User.get_unavailable_usernames(candidates, session)
+        if free:
+            session.execute(
+                insert(cls), [{"username": username} for username in sorted(free)]
+            )
+            session.commit()
+        logger.info(f"Reserved {len(free)} usernames")
+        return len(free)
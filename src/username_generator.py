@@ -0,0 +1,186 @@
+import envs
+import json
+import logging
+import math
+import random
+from typing import List, Optional, Sequence
+
+import httpx
+
+from http_clients import http_clients
+from storage import run_read_in_session
+from user_group_db.models import User
+from username_words import ADJECTIVES, ANIMALS
+
+logger = logging.getLogger(__name__)
+
+# how many usernames are requested from the agent in one call
+CANDIDATES_PER_REQUEST = 10
+# upper bound of candidates requested in one call for bulk generation
+MAX_CANDIDATES_PER_REQUEST = 100
+# how many batches are tried before giving up
+LIMIT_ATTEMPTS = 3
+
+
+class UsernameGenerationError(RuntimeError):
+    """Raised when no username candidates could be generated."""
+
+
+async def request_agent_candidates(count: int = CANDIDATES_PER_REQUEST) -> List[str]:
+    """Ask the agent for `count` username candidates in one round trip."""
+    url = f"{envs.AGENT_ENDPOINT}/message"
+    payload = {
+        "message": (
+            f"Generate {count} different kids friendly funny sounding usernames, "
+            "each contains of some animal and adjective"
+        ),
+        "structured_output": True,
+        "user_id": "service",
+        "role": "service",
+        "json_schema": {
+            "name": "username_candidates",  # required by OpenAI structured outputs
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "usernames": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["usernames"],
+            },
+        },
+    }
+    response = await http_clients.agent.post(
+        url, json=payload, timeout=envs.AGENT_USERNAME_TIMEOUT_SECONDS
+    )
+    if response.status_code != 200:
+        logger.error(f"Error generating username: {response.text}")
+        raise UsernameGenerationError("Error generating username")
+
+    try:
+        data = response.json()
+        logger.info(f"Response: {data}")
+        message = json.loads(data.get("message", ""))
+        candidates = [
+            username.strip()
+            for username in message.get("usernames", [])
+            if isinstance(username, str) and username.strip()
+        ]
+    except (ValueError, AttributeError, TypeError) as e:
+        # json.JSONDecodeError is a ValueError
+        logger.error(f"Malformed agent response {response.text!r}: {e!r}")
+        raise UsernameGenerationError("Malformed agent response") from e
+    if not candidates:
+        logger.error("Username is empty")
+        raise UsernameGenerationError("Username is empty")
+    # keep the agent's order, drop duplicates
+    return list(dict.fromkeys(candidates))
+
+
+class LocalUsernameGenerator:
+    """Offline "adjective + animal + optional number" username generator.
+
+    Candidates come from a walk over a random permutation of the whole
+    index space (`start + i * step` modulo its size, with `step` coprime to
+    the size), so a process never proposes the same name twice and names
+    taken by earlier users are hit only with probability taken / size.
+    """
+
+    def __init__(
+        self,
+        adjectives: Sequence[str] = ADJECTIVES,
+        animals: Sequence[str] = ANIMALS,
+        numbers: int = 100,
+        rng: Optional[random.Random] = None,
+    ):
+        self.adjectives = adjectives
+        self.animals = animals
+        self.size = len(adjectives) * len(animals) * numbers
+        self._rng = rng or random.SystemRandom()
+        self._start = self._rng.randrange(self.size)
+        self._step = self._random_step()
+        self._position = 0
+
+    def _random_step(self) -> int:
+        while True:
+            step = self._rng.randrange(1, self.size)
+            if math.gcd(step, self.size) == 1:
+                return step
+
+    def name(self, index: int) -> str:
+        index, adjective = divmod(index, len(self.adjectives))
+        number, animal = divmod(index, len(self.animals))
+        suffix = str(number) if number else ""
+        return f"{self.adjectives[adjective]}{self.animals[animal]}{suffix}"
+
+    def candidates(self, count: int) -> List[str]:
+        """Return the next `count` distinct names of the walk."""
+        names = []
+        for _ in range(count):
+            if self._position == self.size:
+                # the whole space was walked, start another permutation
+                self._start = self._rng.randrange(self.size)
+                self._step = self._random_step()
+                self._position = 0
+            index = (self._start + self._position * self._step) % self.size
+            names.append(self.name(index))
+            self._position += 1
+        return names
+
+
+local_generator = LocalUsernameGenerator()
+
+
+async def generate_candidates(count: int = CANDIDATES_PER_REQUEST) -> List[str]:
+    """Return username candidates from the generator set by `USERNAME_GENERATOR`."""
+    if envs.USERNAME_GENERATOR == "local":
+        return local_generator.candidates(count)
+    try:
+        return await request_agent_candidates(count)
+    except (UsernameGenerationError, httpx.HTTPError) as e:
+        if envs.USERNAME_GENERATOR != "agent_with_local_fallback":
+            logger.error(f"Error generating username: {e!r}")
+            raise UsernameGenerationError("Error generating username") from e
+        logger.warning(f"Agent failed to generate usernames, using local: {e!r}")
+        return local_generator.candidates(count)
+
+
+async def generate_free_username() -> str:
+    """Return a generated username that is not taken yet."""
+    for _ in range(LIMIT_ATTEMPTS):
+        candidates = await generate_candidates()
+        # all candidates are checked with one query
+        username = await run_read_in_session(User.pick_free_username, candidates)
+        if username:
+            return username
+        logger.info(f"All username candidates already exist: {candidates}")
+    raise UsernameGenerationError("Username already exists")
+
+
+async def generate_free_usernames(count: int, exclude: Sequence[str] = ()) -> List[str]:
+    """Return `count` distinct generated usernames that are not taken yet.
+
+    `exclude` are usernames already handed out but not saved yet (e.g. just
+    taken from the pool), they are not returned either.
+    """
+    usernames: List[str] = []
+    chosen = set(exclude)
+    failed_attempts = 0
+    while len(usernames) < count:
+        missing = count - len(usernames)
+        candidates = await generate_candidates(
+            min(max(missing, CANDIDATES_PER_REQUEST), MAX_CANDIDATES_PER_REQUEST)
+        )
+        candidates = [c for c in dict.fromkeys(candidates) if c not in chosen]
+        unavailable = await run_read_in_session(
+            User.get_unavailable_usernames, candidates
+        )
+        free = [c for c in candidates if c not in unavailable][:missing]
+        if not free:
+            failed_attempts += 1
+            if failed_attempts >= LIMIT_ATTEMPTS:
+                raise UsernameGenerationError("Username already exists")
+            continue
+        usernames.extend(free)
+        chosen.update(free)
+    return usernames
@@ -0,0 +1,98 @@
+import envs
+import hashlib
+import logging
+import math
+import threading
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter for strings (no false negatives)."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, value: str) -> None:
+        with self._lock:
+            for position in self._positions(value):
+                self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+class UsernameIndex:
+    """In-memory index answering "may this username exist?".
+
+    A negative answer is definite, so the DB lookup can be skipped; a
+    positive one still has to be confirmed in the DB. Until `load` has
+    finished every username "may exist", so the index is never consulted
+    half-built. New usernames are added by the `User` model on insert and
+    update.
+    """
+
+    def __init__(self, kind: str, capacity: int, error_rate: float):
+        self.kind = kind
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.loaded = False
+        self._usernames = self._empty()
+        self.skipped_lookups = 0
+
+    def _empty(self):
+        if self.kind == "bloom":
+            return BloomFilter(self.capacity, self.error_rate)
+        return set()
+
+    def add(self, username: str) -> None:
+        if self.kind != "off" and username:
+            self._usernames.add(username)
+
+    def might_exist(self, username: str) -> bool:
+        if not self.loaded or username in self._usernames:
+            return True
+        self.skipped_lookups += 1
+        return False
+
+    def load(self, usernames: Iterable[str]) -> None:
+        """Fill the index from a (streamed) scan of all usernames."""
+        if self.kind == "off":
+            return
+        count = 0
+        for username in usernames:
+            self.add(username)
+            count += 1
+        self.loaded = True
+        logger.info(f"Username index ({self.kind}) loaded with {count} usernames")
+
+    def reset(self) -> None:
+        self.loaded = False
+        self._usernames = self._empty()
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "loaded": self.loaded,
+            "skipped_lookups": self.skipped_lookups,
+        }
+
+
+username_index = UsernameIndex(
+    envs.USERNAME_INDEX, envs.USERNAME_INDEX_CAPACITY, envs.USERNAME_INDEX_ERROR_RATE
+)
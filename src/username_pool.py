@@ -0,0 +1,147 @@
+import asyncio
+import envs
+import logging
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+from storage import run_in_session, run_read_in_session
+from user_group_db.models import ReservedUsername
+from username_generator import (
+    generate_candidates,
+    generate_free_username,
+    generate_free_usernames,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UsernamePool:
+    """Pool of pre-generated usernames stored in the `username_pool` table.
+
+    `acquire` takes a reserved username with one DB statement and only
+    falls back to `generate` when the pool is empty. A background worker
+    refills the pool up to `target` once it drops below `low_water`.
+    """
+
+    def __init__(
+        self,
+        generate_candidates: Callable[[], Awaitable[List[str]]],
+        generate: Callable[[], Awaitable[str]],
+        target: int,
+        low_water: int,
+        check_seconds: float,
+        generate_many: Optional[
+            Callable[[int, Sequence[str]], Awaitable[List[str]]]
+        ] = None,
+    ):
+        self._generate_candidates = generate_candidates
+        self._generate = generate
+        self._generate_many = generate_many
+        self.target = target
+        self.low_water = low_water
+        self.check_seconds = check_seconds
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.taken = 0
+        self.fallbacks = 0
+        self.refill_errors = 0
+
+    async def acquire(self) -> str:
+        """Return a username that is not taken, preferably from the pool."""
+        if self.target > 0:
+            username = await run_in_session(ReservedUsername.take)
+            # the worker decides whether a refill is needed
+            self._wakeup.set()
+            if username:
+                self.taken += 1
+                return username
+        self.fallbacks += 1
+        logger.info("Username pool is empty, generating a username")
+        return await self._generate()
+
+    async def acquire_many(self, count: int, exclude: Sequence[str] = ()) -> List[str]:
+        """Return `count` distinct usernames, taking as many as possible
+        from the pool with one DB statement.
+
+        Generated usernames are neither the taken ones nor in `exclude`
+        (usernames handed out earlier but not saved yet).
+        """
+        usernames: List[str] = []
+        if self.target > 0 and count > 0:
+            usernames = await run_in_session(ReservedUsername.take_many, count)
+            self._wakeup.set()
+            self.taken += len(usernames)
+        missing = count - len(usernames)
+        if missing > 0:
+            self.fallbacks += 1
+            logger.info(f"Username pool is short of {missing} usernames, generating")
+            if self._generate_many is not None:
+                usernames += await self._generate_many(missing, [*exclude, *usernames])
+            else:
+                for _ in range(missing):
+                    usernames.append(await self._generate())
+        return usernames
+
+    async def refill(self) -> int:
+        """Fill the pool up to `target` if it is below `low_water`.
+
+        Returns number of added usernames.
+        """
+        size = await run_read_in_session(ReservedUsername.count)
+        if size >= self.low_water:
+            return 0
+        added = 0
+        while size < self.target:
+            candidates = await self._generate_candidates()
+            added_now = await run_in_session(ReservedUsername.add_many, candidates)
+            if not added_now:
+                # every candidate was taken, do not spin on the agent
+                break
+            added += added_now
+            size += added_now
+        logger.info(f"Username pool refilled with {added} usernames")
+        return added
+
+    async def _refill_periodically(self) -> None:
+        while True:
+            try:
+                await self.refill()
+            except Exception as e:
+                self.refill_errors += 1
+                logger.warning(f"Username pool refill failed: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.check_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self.target > 0 and self._task is None:
+            self._task = asyncio.create_task(self._refill_periodically())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "target": self.target,
+            "low_water": self.low_water,
+            "taken": self.taken,
+            "fallbacks": self.fallbacks,
+            "refill_errors": self.refill_errors,
+        }
+
+
+username_pool = UsernamePool(
+    generate_candidates,
+    generate_free_username,
+    envs.USERNAME_POOL_TARGET,
+    envs.USERNAME_POOL_LOW_WATER,
+    envs.USERNAME_POOL_CHECK_SECONDS,
+    generate_many=generate_free_usernames,
+)
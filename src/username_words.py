@@ -0,0 +1,38 @@
+"""Word lists for the offline username generator."""
+
+ADJECTIVES = tuple(
+    """
+Amazing Bouncy Brave Breezy Bright Bubbly Bumpy Busy Calm Careful Charming
+Cheeky Cheerful Chill Chirpy Chubby Clever Comfy Cosmic Cozy Crafty Cuddly
+Curious Curly Daring Dazzling Dizzy Dreamy Eager Epic Fancy Fearless Feisty
+Fluffy Friendly Frosty Funky Funny Fuzzy Gentle Giant Giggly Glowing Golden
+Goofy Grand Groovy Happy Helpful Honest Hoppy Huggy Humble Jazzy Jolly Jumpy
+Kind Lazy Lively Lovely Lucky Magic Merry Mighty Misty Modest Noble Nimble Peppy
+Perky Plucky Polite Proud Puffy Quick Quiet Quirky Rapid Rosy Round Rusty Shiny
+Silky Silly Sleepy Slick Smart Smiley Snappy Sneaky Snowy Snuggly Soft Sparkly
+Speedy Spicy Spotty Sprightly Spunky Starry Steady Sticky Stripy Sturdy Sunny
+Super Sweet Swift Tall Tidy Tiny Toasty Tricky Trusty Turbo Wacky Wavy Whimsical
+Wiggly Wild Windy Wise Witty Wobbly Wonder Zany Zappy Zesty Zippy Zoomy Bold
+Cool Crispy Dapper Fizzy Frisky Gleeful Hasty Icy Joyful Keen Loyal Mellow Nifty
+Peaceful Radiant Snazzy Stellar Tender Thrilled Upbeat Vivid Warm
+""".split()
+)
+
+ANIMALS = tuple(
+    """
+Aardvark Alpaca Ant Antelope Armadillo Badger Bat Bear Beaver Bee Beetle Bison
+Bunny Butterfly Camel Capybara Cat Caterpillar Cheetah Chick Chinchilla Chipmunk
+Cobra Cougar Cow Coyote Crab Crane Cricket Crocodile Crow Deer Dingo Dodo Dog
+Dolphin Donkey Dove Dragonfly Duck Eagle Eel Elephant Elk Emu Falcon Ferret
+Finch Firefly Flamingo Fox Frog Gazelle Gecko Gerbil Gibbon Giraffe Goat
+Goldfish Goose Gopher Gorilla Grasshopper Hamster Hare Hawk Hedgehog Heron Hippo
+Horse Hummingbird Hyena Ibis Iguana Impala Jackal Jaguar Jellyfish Kangaroo
+Kitten Kiwi Koala Ladybug Lamb Lemur Leopard Lion Lizard Llama Lobster Lynx
+Macaw Manatee Meerkat Mole Mongoose Monkey Moose Moth Mouse Narwhal Newt Ocelot
+Octopus Orca Ostrich Otter Owl Ox Panda Panther Parrot Peacock Pelican Penguin
+Pig Pigeon Platypus Pony Porcupine Possum Puffin Puma Puppy Quail Rabbit Raccoon
+Ram Raven Reindeer Rhino Robin Salamander Salmon Seahorse Seal Shark Sheep
+Shrimp Skunk Sloth Snail Sparrow Squid Squirrel Starfish Stork Swan Tapir Tiger
+Toad Toucan Turkey Turtle Walrus Weasel Whale Wolf Wombat Woodpecker Yak Zebra
+""".split()
+)
@@ -1,7 +1,24 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 # Add the src directory to the Python path for imports during testing
 src_path = Path(__file__).parent.parent / "src"
 if str(src_path) not in sys.path:
     sys.path.insert(0, str(src_path))
+
+
+@pytest.fixture
+def db_executor(mocker):
+    """Route `run_in_session` to a thread pool working on the test database."""
+    import storage
+    import user_group_db.models  # noqa: F401 - register tables
+
+    storage.init_db(storage.engine)
+    executor = storage.BlockingExecutor(storage.SessionLocal, 1, 100)
+    mocker.patch("envs.DB_EXECUTOR", "threadpool")
+    mocker.patch("storage.blocking_executor", executor)
+    yield executor
+    executor.shutdown()
+    storage.Base.metadata.drop_all(bind=storage.engine)
@@ -0,0 +1,108 @@
+import asyncio
+
+from cache import MISSING, TTLCache, UserLookupCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(max_size=10, ttl_seconds=5, clock=clock)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    clock.now = 5
+    assert cache.get("a") is MISSING
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["expirations"] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_keeps_none_values():
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.set("a", None)
+    assert cache.get("a") is None
+
+
+def test_user_lookup_cache_reads_through_and_invalidates_by_username():
+    calls = []
+
+    async def loader(user_id):
+        calls.append(user_id)
+        return {"username": "kid", "is_activated": False}
+
+    async def scenario():
+        cache = UserLookupCache(max_size=10, ttl_seconds=60)
+        await cache.get_or_load("1", loader)
+        await cache.get_or_load("1", loader)
+        assert calls == ["1"]
+
+        cache.invalidate_username("kid")
+        await cache.get_or_load("1", loader)
+        assert calls == ["1", "1"]
+        return cache.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_user_lookup_cache_caches_unknown_user_ids():
+    calls = []
+
+    async def loader(user_id):
+        calls.append(user_id)
+        return None
+
+    async def scenario():
+        cache = UserLookupCache(max_size=10, ttl_seconds=60)
+        assert await cache.get_or_load("1", loader) is None
+        assert await cache.get_or_load("1", loader) is None
+        cache.invalidate_user_id("1")
+        await cache.get_or_load("1", loader)
+
+    asyncio.run(scenario())
+    assert calls == ["1", "1"]
+
+
+def test_user_lookup_cache_drops_value_invalidated_while_loading():
+    async def scenario():
+        cache = UserLookupCache(max_size=10, ttl_seconds=60)
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_loader(user_id):
+            started.set()
+            await release.wait()
+            return None
+
+        async def fresh_loader(user_id):
+            return {"username": "kid", "is_activated": True}
+
+        load = asyncio.create_task(cache.get_or_load("1", slow_loader))
+        await started.wait()
+        # the account is created while the old value is being loaded
+        cache.invalidate_user_id("1")
+        release.set()
+        assert await load is None
+
+        return await cache.get_or_load("1", fresh_loader)
+
+    assert asyncio.run(scenario()) == {"username": "kid", "is_activated": True}
@@ -0,0 +1,27 @@
+import asyncio
+
+from http_clients import HttpClients
+
+
+def test_clients_are_reused_per_upstream():
+    async def scenario():
+        clients = HttpClients()
+        await clients.start()
+        agent = clients.agent
+        assert clients.agent is agent
+        assert clients.registry is not agent
+        await clients.close()
+        assert agent.is_closed
+        # a closed manager hands out a fresh client again
+        reopened = clients.agent
+        assert reopened is not agent
+        await clients.close()
+
+    asyncio.run(scenario())
+
+
+def test_http2_falls_back_without_h2(mocker):
+    mocker.patch("envs.HTTP2_ENABLED", True)
+    mocker.patch("http_clients.httpx.AsyncClient", side_effect=[ImportError, "client"])
+
+    assert HttpClients().agent == "client"
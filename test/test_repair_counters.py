@@ -0,0 +1,76 @@
+from sqlalchemy import MetaData, create_engine, event, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from repair_counters import add_counter_columns
+from storage import Base, enable_sqlite_foreign_keys
+from user_group_db.models import Group, User, recount_memberships
+
+
+def test_add_counter_columns_upgrades_old_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        # back to the schema before the counters existed
+        connection.execute(text("ALTER TABLE groups DROP COLUMN users_count"))
+        connection.execute(text("ALTER TABLE users DROP COLUMN groups_count"))
+        connection.execute(
+            text(
+                "INSERT INTO users (id, user_id, username, is_activated)"
+                " VALUES (1, '1', 'first', 1), (2, '2', 'second', 1)"
+            )
+        )
+        connection.execute(text("INSERT INTO groups (id, name) VALUES (1, 'Group')"))
+        connection.execute(
+            text("INSERT INTO group_user_association VALUES (1, 1), (1, 2)")
+        )
+
+    add_counter_columns(engine)
+    # running it again is a no-op
+    add_counter_columns(engine)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("users")}
+    assert "groups_count" in columns
+    with sessionmaker(bind=engine)() as session:
+        recount_memberships(session)
+        assert session.query(Group.users_count).scalar() == 2
+        assert [count for (count,) in session.query(User.groups_count)] == [1, 1]
+    engine.dispose()
+
+
+def test_deletes_work_without_cascade_rules(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    event.listen(engine, "connect", enable_sqlite_foreign_keys)
+    # the foreign keys of databases created before ON DELETE rules existed
+    old_metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table.to_metadata(old_metadata)
+    for table in old_metadata.tables.values():
+        for foreign_key in table.foreign_keys:
+            foreign_key.constraint.ondelete = None
+    old_metadata.create_all(bind=engine)
+
+    with sessionmaker(bind=engine)() as session:
+        User.create(user_id="teacher", username="teacher", session=session)
+        User.create(user_id="student", username="student", session=session)
+        first = Group.create(
+            name="First",
+            usernames=["student"],
+            owner_user_id="teacher",
+            session=session,
+        )
+        second = Group.create(
+            name="Second",
+            usernames=["student"],
+            owner_user_id="teacher",
+            session=session,
+        )
+
+        assert Group.delete_by_id(first["id"], session) is True
+        assert sorted(User.delete_many(["teacher", "student"], session)) == [
+            "student",
+            "teacher",
+        ]
+        group = Group.get_by_id(second["id"], session)
+        assert group["owner"] is None
+        assert group["users_count"] == 0
+    engine.dispose()
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from role_cache import RegistryError, RoleCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_fetch(responses):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        response = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return fetch, calls
+
+
+def test_roles_are_downloaded_once_per_ttl():
+    fetch, calls = make_fetch([{"1": "teacher"}, {"1": "student"}])
+    clock = FakeClock()
+    cache = RoleCache(fetch, ttl_seconds=10, clock=clock)
+
+    async def scenario():
+        await cache.ensure_fresh()
+        await cache.ensure_fresh()
+        assert cache.get_roles(["1", "2"]) == {"1": "teacher", "2": None}
+        clock.now = 10
+        await cache.ensure_fresh()
+        assert cache.get_roles(["1"]) == {"1": "student"}
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_roles_removed_from_registry_are_dropped():
+    fetch, _ = make_fetch([{"1": "teacher", "2": "student"}, {"2": "student"}])
+    cache = RoleCache(fetch, ttl_seconds=10)
+
+    async def scenario():
+        await cache.refresh()
+        cache.set_role("3", "teacher")
+        await cache.refresh()
+
+    asyncio.run(scenario())
+    assert cache.get_roles(["1", "2", "3"]) == {"1": None, "2": "student", "3": None}
+
+
+def test_set_role_during_refresh_is_kept():
+    cache = None
+
+    async def fetch():
+        # the user is created while the registry is being downloaded
+        cache.set_role("1", "teacher")
+        await asyncio.sleep(0)
+        return {"2": "student"}
+
+    cache = RoleCache(fetch, ttl_seconds=10)
+    asyncio.run(cache.refresh())
+    assert cache.get_roles(["1", "2"]) == {"1": "teacher", "2": "student"}
+
+
+def test_registry_is_not_downloaded_without_reads():
+    fetch, calls = make_fetch([{"1": "teacher"}])
+    clock = FakeClock()
+    cache = RoleCache(fetch, ttl_seconds=10, clock=clock)
+
+    async def scenario():
+        await cache.ensure_fresh()
+        clock.now = 1000
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+
+
+def test_stale_roles_are_served_when_refresh_fails():
+    fetch, _ = make_fetch([{"1": "teacher"}, RegistryError("down")])
+    clock = FakeClock()
+    cache = RoleCache(fetch, ttl_seconds=10, clock=clock)
+
+    async def scenario():
+        await cache.ensure_fresh()
+        clock.now = 20
+        await cache.ensure_fresh()
+
+    asyncio.run(scenario())
+    assert cache.get_roles(["1"]) == {"1": "teacher"}
+    assert cache.stats()["refresh_errors"] == 1
+
+
+def test_error_is_raised_when_nothing_is_loaded():
+    fetch, _ = make_fetch([RegistryError("down")])
+    cache = RoleCache(fetch, ttl_seconds=10)
+
+    with pytest.raises(RegistryError):
+        asyncio.run(cache.ensure_fresh())
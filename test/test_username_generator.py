@@ -0,0 +1,139 @@
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from storage import run_in_session
+from user_group_db.models import User
+from username_generator import (
+    LocalUsernameGenerator,
+    UsernameGenerationError,
+    generate_candidates,
+    generate_free_usernames,
+    request_agent_candidates,
+)
+
+
+def patch_agent(mocker, status_code, message):
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(status_code, json={"message": json.dumps(message)})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    mocker.patch("envs.AGENT_ENDPOINT", "http://agent")
+    mocker.patch("username_generator.http_clients", SimpleNamespace(agent=client))
+    return requests
+
+
+def test_agent_candidates_are_requested_in_one_call(mocker):
+    requests = patch_agent(
+        mocker, 200, {"usernames": ["HappyPanda", " HappyPanda", "", "SillyOwl"]}
+    )
+
+    candidates = asyncio.run(request_agent_candidates(3))
+
+    assert candidates == ["HappyPanda", "SillyOwl"]
+    assert len(requests) == 1
+    schema = requests[0]["json_schema"]["schema"]
+    assert schema["properties"]["usernames"]["type"] == "array"
+
+
+def test_agent_error_is_raised(mocker):
+    patch_agent(mocker, 500, {})
+
+    with pytest.raises(UsernameGenerationError):
+        asyncio.run(request_agent_candidates())
+
+
+def test_empty_candidates_are_rejected(mocker):
+    patch_agent(mocker, 200, {"usernames": []})
+
+    with pytest.raises(UsernameGenerationError, match="empty"):
+        asyncio.run(request_agent_candidates())
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"not json",
+        b'["list"]',
+        b'{"message": "not json"}',
+        b'{"message": "[\\"list\\"]"}',
+        b'{"message": 42}',
+    ],
+)
+def test_malformed_agent_response_falls_back_to_local_generator(mocker, body):
+    def handler(request):
+        return httpx.Response(200, content=body)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    mocker.patch("envs.AGENT_ENDPOINT", "http://agent")
+    mocker.patch("username_generator.http_clients", SimpleNamespace(agent=client))
+
+    with pytest.raises(UsernameGenerationError, match="Malformed"):
+        asyncio.run(request_agent_candidates())
+
+    mocker.patch("envs.USERNAME_GENERATOR", "agent_with_local_fallback")
+    assert len(asyncio.run(generate_candidates(5))) == 5
+
+
+def test_local_generator_walks_whole_space_without_repeats():
+    generator = LocalUsernameGenerator(
+        ("Happy", "Silly"), ("Panda", "Owl", "Fox"), numbers=3, rng=random.Random(1)
+    )
+
+    names = generator.candidates(generator.size)
+
+    assert len(set(names)) == generator.size == 18
+    assert {"HappyPanda", "SillyFox2"} <= set(names)
+
+
+def test_local_generator_has_millions_of_names():
+    generator = LocalUsernameGenerator(rng=random.Random(1))
+
+    assert generator.size > 1_000_000
+    assert len(set(generator.candidates(1000))) == 1000
+
+
+def test_agent_timeout_falls_back_to_local_generator(mocker):
+    def handler(request):
+        raise httpx.ReadTimeout("timeout", request=request)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    mocker.patch("envs.AGENT_ENDPOINT", "http://agent")
+    mocker.patch("username_generator.http_clients", SimpleNamespace(agent=client))
+
+    mocker.patch("envs.USERNAME_GENERATOR", "agent_with_local_fallback")
+    assert len(asyncio.run(generate_candidates(5))) == 5
+
+    mocker.patch("envs.USERNAME_GENERATOR", "agent")
+    with pytest.raises(UsernameGenerationError):
+        asyncio.run(generate_candidates(5))
+
+
+def test_local_mode_does_not_call_agent(mocker):
+    requests = patch_agent(mocker, 200, {"usernames": ["HappyPanda"]})
+    mocker.patch("envs.USERNAME_GENERATOR", "local")
+
+    assert len(asyncio.run(generate_candidates(3))) == 3
+    assert requests == []
+
+
+def test_generate_free_usernames_skips_taken_names(mocker, db_executor):
+    batches = iter([["Taken", "A", "A"], ["B", "C", "D"]])
+
+    async def fake_candidates(count):
+        return next(batches)
+
+    mocker.patch("username_generator.generate_candidates", fake_candidates)
+
+    async def scenario():
+        await run_in_session(User.create, username="Taken")
+        return await generate_free_usernames(3)
+
+    assert asyncio.run(scenario()) == ["A", "B", "C"]
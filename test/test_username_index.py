@@ -0,0 +1,34 @@
+from username_index import BloomFilter, UsernameIndex
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    usernames = [f"user-{index}" for index in range(1000)]
+    for username in usernames:
+        bloom.add(username)
+    assert all(username in bloom for username in usernames)
+    false_positives = sum(f"other-{index}" in bloom for index in range(1000))
+    assert false_positives < 50
+
+
+def test_index_is_pass_through_until_loaded():
+    index = UsernameIndex("set", capacity=100, error_rate=0.01)
+    assert index.might_exist("HappyPanda")
+    index.load(["SillyOwl"])
+    assert index.might_exist("SillyOwl")
+    assert not index.might_exist("HappyPanda")
+    index.add("HappyPanda")
+    assert index.might_exist("HappyPanda")
+    assert index.stats()["skipped_lookups"] == 1
+
+
+def test_bloom_index():
+    index = UsernameIndex("bloom", capacity=100, error_rate=0.01)
+    index.load(["SillyOwl"])
+    assert index.might_exist("SillyOwl")
+
+
+def test_disabled_index_never_loads():
+    index = UsernameIndex("off", capacity=100, error_rate=0.01)
+    index.load(["SillyOwl"])
+    assert index.might_exist("HappyPanda")
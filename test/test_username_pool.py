@@ -0,0 +1,91 @@
+import asyncio
+
+from storage import run_in_session
+from user_group_db.models import ReservedUsername, User
+from username_generator import generate_free_usernames
+from username_pool import UsernamePool
+
+
+def make_pool(batches, target=4, low_water=2, generate_many=None):
+    calls = []
+
+    async def generate_candidates():
+        calls.append(1)
+        return batches[min(len(calls), len(batches)) - 1]
+
+    async def generate():
+        return "Generated"
+
+    pool = UsernamePool(
+        generate_candidates,
+        generate,
+        target=target,
+        low_water=low_water,
+        check_seconds=60,
+        generate_many=generate_many,
+    )
+    return pool, calls
+
+
+def test_refill_fills_pool_up_to_target(db_executor):
+    pool, calls = make_pool([["A", "B", "C"], ["C", "D", "E"]])
+
+    async def scenario():
+        assert await pool.refill() == 5
+        # above the low-water mark nothing is generated
+        assert await pool.refill() == 0
+        return await run_in_session(ReservedUsername.count)
+
+    assert asyncio.run(scenario()) == 5
+    assert len(calls) == 2
+
+
+def test_refill_stops_when_every_candidate_is_taken(db_executor):
+    pool, calls = make_pool([["Taken"]])
+
+    async def scenario():
+        await run_in_session(User.create, username="Taken")
+        return await pool.refill()
+
+    assert asyncio.run(scenario()) == 0
+    assert len(calls) == 1
+
+
+def test_acquire_prefers_pool_and_falls_back_to_generation(db_executor):
+    pool, _ = make_pool([["A"]])
+
+    async def scenario():
+        await run_in_session(ReservedUsername.add_many, ["Pooled"])
+        return [await pool.acquire(), await pool.acquire()]
+
+    assert asyncio.run(scenario()) == ["Pooled", "Generated"]
+    assert pool.stats()["taken"] == 1
+    assert pool.stats()["fallbacks"] == 1
+
+
+def test_acquire_many_takes_pool_in_one_batch(db_executor):
+    pool, _ = make_pool([["A"]])
+
+    async def scenario():
+        await run_in_session(ReservedUsername.add_many, ["P1", "P2"])
+        return await pool.acquire_many(3)
+
+    assert sorted(asyncio.run(scenario())) == ["Generated", "P1", "P2"]
+    assert pool.stats()["taken"] == 2
+    assert pool.stats()["fallbacks"] == 1
+
+
+def test_acquire_many_does_not_generate_names_taken_from_pool(db_executor, mocker):
+    batches = iter([["HappyPanda", "SillyOwl"]])
+
+    async def fake_candidates(count):
+        return next(batches)
+
+    mocker.patch("username_generator.generate_candidates", fake_candidates)
+    pool, _ = make_pool([["A"]], generate_many=generate_free_usernames)
+
+    async def scenario():
+        await run_in_session(ReservedUsername.add_many, ["HappyPanda"])
+        return await pool.acquire_many(2)
+
+    assert asyncio.run(scenario()) == ["HappyPanda", "SillyOwl"]
@@ -1,4 +1,5 @@
 import pytest
+from sqlalchemy import event
 
 from storage import SessionLocal, init_db, engine, Base
 
@@ -14,3 +15,16 @@ def session():
     # otherwise data from previous test will be
     # present in the next test
     Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def count_queries():
+    """Return a list collecting every SQL statement sent to the engine."""
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    yield statements
+    event.remove(engine, "before_cursor_execute", _before_cursor_execute)
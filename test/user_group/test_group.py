@@ -1,6 +1,13 @@
 import pytest
+from sqlalchemy import event, update
 
-from user_group_db.models import User, Group
+from storage import engine
+from user_group_db.models import (
+    Group,
+    User,
+    group_user_association,
+    recount_memberships,
+)
 
 
 def test_create_group(session):
@@ -21,12 +28,65 @@ def test_create_group_with_users(session):
     assert Group.get_by_name("Test Group", session)["users_count"] == 1
 
 
+def test_create_group_resolves_users_in_bulk(session, count_queries):
+    for index in range(20):
+        User.create(username=f"student-{index}", session=session)
+    count_queries.clear()
+
+    group = Group.create(
+        name="Test Group",
+        usernames=[f"student-{index}" for index in range(20)]
+        + ["missing", "student-0", "other"],
+        session=session,
+    )
+    assert group["added_users_count"] == 20
+    assert group["not_found_usernames"] == ["missing", "other"]
+    # name check, group insert, user lookup, association insert, counters
+    # of the group and of the users (with activation) and reading the
+    # committed group back - independent of the class size
+    assert len(count_queries) == 7
+
+    assert Group.get_by_name("Test Group", session)["users_count"] == 20
+    assert all(user.is_activated for user in session.query(User).filter(User.id <= 20))
+
+
 def test_delete_group(session):
     group = Group.create(name="Test Group", session=session)
     assert Group.delete_by_id(group["id"], session) is True
     assert Group.get_by_name("Test Group", session) is None
 
 
+def test_delete_group_with_members_in_constant_statements(session, count_queries):
+    User.create(user_id="teacher", username="teacher", session=session)
+    for index in range(50):
+        User.create(username=f"student-{index}", session=session)
+    group = Group.create(
+        name="Test Group",
+        usernames=["teacher"] + [f"student-{index}" for index in range(50)],
+        owner_user_id="teacher",
+        session=session,
+    )
+    Group.create(name="Other", usernames=["student-0"], session=session)
+    teacher_id = session.query(User.id).filter(User.user_id == "teacher").scalar()
+    count_queries.clear()
+
+    deactivated = User.deactivate_last_group_members(
+        group["id"], session, keep_id=teacher_id
+    )
+    assert Group.delete_by_id(group["id"], session) is True
+    assert deactivated == 49
+    # deactivation, members counters, memberships delete and group delete
+    assert len(count_queries) == 4
+    assert Group.get_students(group["id"], session) == []
+
+    activated = dict(session.query(User.username, User.is_activated))
+    assert activated["teacher"] is True
+    assert activated["student-0"] is True
+    assert activated["student-1"] is False
+    assert Group.get_by_name("Other", session)["users_count"] == 1
+    assert Group.delete_by_id(group["id"], session) is False
+
+
 def test_add_user_to_group(session):
     User.create(username="123456789", session=session)
     group = Group.create(name="Test Group", session=session)
@@ -43,6 +103,28 @@ def test_remove_user_from_group(session):
     assert Group.get_by_name("Test Group", session)["users_count"] == 0
 
 
+def test_membership_changes_do_not_load_members(session, count_queries):
+    for index in range(30):
+        User.create(username=f"student-{index}", session=session)
+    group = Group.create(
+        name="Test Group",
+        usernames=[f"student-{index}" for index in range(29)],
+        session=session,
+    )
+    user_id = session.query(User.id).filter(User.username == "student-29").scalar()
+    count_queries.clear()
+
+    assert Group.add_user(group["id"], "student-29", session) is True
+    assert Group.add_user(group["id"], "student-29", session) is True
+    assert User.count_groups(user_id, session) == 1
+    assert Group.remove_user(group["id"], "student-29", session) is True
+    assert Group.remove_user(group["id"], "student-29", session) is False
+    assert User.count_groups(user_id, session) == 0
+    assert not any("FROM users, group_user_association" in q for q in count_queries)
+    # only single-row probes and writes, however large the group is
+    assert len(count_queries) == 18
+
+
 def test_create_group_with_owner(session):
     User.create(user_id="123456789", session=session)
     Group.create(name="Test Group", owner_user_id="123456789", session=session)
@@ -62,3 +144,282 @@ def test_create_group_without_owner(session):
 def test_create_group_with_invalid_owner(session):
     with pytest.raises(ValueError, match="Owner with user_id '999' not found"):
         Group.create(name="Test Group", owner_user_id="999", session=session)
+
+
+def test_is_owned_by(session):
+    User.create(user_id="teacher", session=session)
+    group = Group.create(name="Test Group", owner_user_id="teacher", session=session)
+    assert Group.is_owned_by(group["id"], "teacher", session) is True
+    assert Group.is_owned_by(group["id"], "someone", session) is False
+    assert Group.is_owned_by(999, "teacher", session) is False
+
+
+def test_get_students_returns_only_activated(session):
+    User.create(user_id="1", username="active", session=session)
+    User.create(user_id="2", username="inactive", session=session)
+    group = Group.create(name="Test Group", usernames=["active"], session=session)
+    Group.add_user(group["id"], "inactive", session)
+    assert Group.get_students(group["id"], session) == [
+        {"id": 1, "username": "active", "user_id": "1"}
+    ]
+
+
+def test_get_groups_counts_users_and_owner(session):
+    User.create(user_id="teacher", username="teacher", session=session)
+    User.create(user_id="1", username="first", session=session)
+    User.create(user_id="2", username="second", session=session)
+    Group.create(
+        name="Full",
+        usernames=["first", "second"],
+        owner_user_id="teacher",
+        session=session,
+    )
+    Group.create(name="Empty", owner_user_id="teacher", session=session)
+    Group.create(name="Orphan", usernames=["first"], session=session)
+
+    groups = {group["name"]: group for group in Group.get_groups(session)}
+    assert groups["Full"]["users_count"] == 2
+    assert groups["Empty"]["users_count"] == 0
+    assert groups["Orphan"]["users_count"] == 1
+    assert groups["Full"]["owner"] == {"user_id": "teacher", "username": "teacher"}
+    assert groups["Orphan"]["owner"] is None
+
+    owned = Group.get_groups(session, owner_user_id="teacher")
+    assert [group["name"] for group in owned] == ["Full", "Empty"]
+
+
+def _create_groups_with_students(session, start, count, students_per_group=3):
+    for index in range(start, start + count):
+        usernames = []
+        for student in range(students_per_group):
+            username = f"student-{index}-{student}"
+            User.create(username=username, session=session)
+            usernames.append(username)
+        Group.create(
+            name=f"Group {index}",
+            usernames=usernames,
+            owner_user_id="teacher",
+            session=session,
+        )
+
+
+def test_get_groups_query_count_does_not_grow_with_groups(session, count_queries):
+    User.create(user_id="teacher", username="teacher", session=session)
+    _create_groups_with_students(session, 0, 2)
+    session.expire_all()
+    count_queries.clear()
+    assert len(Group.get_groups(session, owner_user_id="teacher")) == 2
+    few_groups_queries = len(count_queries)
+
+    _create_groups_with_students(session, 2, 20)
+    session.expire_all()
+    count_queries.clear()
+    assert len(Group.get_groups(session, owner_user_id="teacher")) == 22
+    assert len(count_queries) == few_groups_queries == 1
+
+
+def test_get_groups_and_students_keyset_pagination(session):
+    User.create(user_id="teacher", username="teacher", session=session)
+    _create_groups_with_students(session, 0, 3, students_per_group=3)
+
+    first_page = Group.get_groups(session, owner_user_id="teacher", limit=2)
+    assert [group["name"] for group in first_page] == ["Group 0", "Group 1"]
+    next_page = Group.get_groups(
+        session, owner_user_id="teacher", limit=2, after_id=first_page[-1]["id"]
+    )
+    assert [group["name"] for group in next_page] == ["Group 2"]
+
+    group_id = first_page[0]["id"]
+    students = Group.get_students(group_id, session, limit=2)
+    assert [student["username"] for student in students] == [
+        "student-0-0",
+        "student-0-1",
+    ]
+    rest = Group.get_students(group_id, session, limit=2, after_id=students[-1]["id"])
+    assert [student["username"] for student in rest] == ["student-0-2"]
+
+
+def test_add_users_in_bulk(session, count_queries):
+    User.create(username="first", session=session)
+    User.create(username="second", session=session)
+    group = Group.create(name="Test Group", usernames=["first"], session=session)
+    count_queries.clear()
+
+    result = Group.add_users(
+        group["id"], ["first", "second", "missing", "second"], session
+    )
+    assert result == {
+        "added": ["second"],
+        "already_in_group": ["first"],
+        "not_found": ["missing"],
+    }
+    # group check, user lookup, conflict-ignoring insert, group and users
+    # counters, activation of existing members
+    assert len(count_queries) == 6
+    assert Group.get_by_name("Test Group", session)["users_count"] == 2
+    assert Group.add_users(404, ["first"], session) is None
+
+
+def test_remove_users_in_bulk_deactivates_users_without_groups(session):
+    User.create(user_id="teacher", username="teacher", session=session)
+    for username in ["first", "second", "outsider"]:
+        User.create(user_id=username, username=username, session=session)
+    group = Group.create(
+        name="Group",
+        usernames=["teacher", "first", "second"],
+        owner_user_id="teacher",
+        session=session,
+    )
+    Group.create(name="Other", usernames=["second"], session=session)
+
+    result = Group.remove_users(
+        group["id"], ["teacher", "first", "second", "outsider", "missing"], session
+    )
+    assert result == {
+        "removed": ["teacher", "first", "second"],
+        "not_in_group": ["outsider"],
+        "not_found": ["missing"],
+    }
+    assert User.get_activated_by_user_ids(["teacher", "first", "second"], session) == {
+        "teacher": True,
+        "first": False,
+        "second": True,
+    }
+
+    assert Group.get_by_name("Group", session)["users_count"] == 0
+
+
+def test_sync_roster_applies_only_the_difference(session, count_queries):
+    User.create(user_id="teacher", username="teacher", session=session)
+    for username in ["first", "second", "third"]:
+        User.create(username=username, session=session)
+    group = Group.create(
+        name="Group",
+        usernames=["teacher", "first", "second"],
+        owner_user_id="teacher",
+        session=session,
+    )
+
+    result = Group.sync_roster(group["id"], ["second", "third", "missing"], session)
+    assert result == {
+        "added": ["third"],
+        "removed": ["first", "teacher"],
+        "not_found": ["missing"],
+    }
+    students = Group.get_students(group["id"], session)
+    assert [student["username"] for student in students] == ["second", "third"]
+    activated = {user.username: user.is_activated for user in session.query(User).all()}
+
+    assert activated == {
+        "teacher": True,
+        "first": False,
+        "second": True,
+        "third": True,
+    }
+
+    count_queries.clear()
+    result = Group.sync_roster(group["id"], ["second", "third"], session)
+    assert result == {"added": [], "removed": [], "not_found": []}
+    # group check, user lookup, delete and insert that change nothing
+    assert len(count_queries) == 4
+    assert Group.sync_roster(404, [], session) is None
+
+
+def _counters_match_memberships(session):
+    association = group_user_association.c
+    for group in session.query(Group):
+        members = session.query(association.user_id).filter(
+            association.group_id == group.id
+        )
+        assert group.users_count == members.count()
+    for user in session.query(User):
+        groups = session.query(association.group_id).filter(
+            association.user_id == user.id
+        )
+        assert user.groups_count == groups.count()
+
+
+def test_member_counters_follow_every_membership_change(session):
+    User.create(user_id="teacher", username="teacher", session=session)
+    for username in ["a", "b", "c", "d"]:
+        User.create(user_id=username, username=username, session=session)
+    first = Group.create(
+        name="First", usernames=["a", "b"], owner_user_id="teacher", session=session
+    )
+    second = Group.create(name="Second", usernames=["b", "c"], session=session)
+    Group.add_user(first["id"], "c", session)
+    Group.remove_user(first["id"], "a", session)
+    Group.add_users(second["id"], ["a", "d", "b"], session)
+    Group.remove_users(second["id"], ["d"], session)
+    Group.sync_roster(first["id"], ["a", "d"], session)
+    User.create_many([{"user_id": "e", "username": "e"}], session, second["id"])
+    User.delete_many(["a"], session)
+    User.deactivate_last_group_members(first["id"], session)
+    Group.delete_by_id(first["id"], session)
+    session.expire_all()
+
+    _counters_match_memberships(session)
+    assert Group.get_by_id(second["id"], session)["users_count"] == 3
+    assert User.get_by_user_id("b", session)["groups_count"] == 1
+    assert User.get_activated_by_user_ids(["d"], session) == {"d": False}
+
+
+def test_recount_memberships_repairs_counters(session):
+    User.create(username="a", session=session)
+    User.create(username="b", session=session)
+    group = Group.create(name="Group", usernames=["a", "b"], session=session)
+    session.execute(update(Group).values(users_count=42))
+    session.execute(update(User).values(groups_count=7))
+    session.commit()
+
+    recount_memberships(session)
+    session.expire_all()
+
+    _counters_match_memberships(session)
+    assert Group.get_by_id(group["id"], session)["users_count"] == 2
+
+
+def _query_plans(session, run) -> str:
+    """Run `run()` and return the SQLite query plans of its statements."""
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, *args):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        run()
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+    connection = session.connection()
+    return "\n".join(
+        row[3]
+        for statement, parameters in statements
+        for row in connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, parameters
+        )
+    )
+
+
+def test_hot_queries_use_indexes(session):
+    User.create(user_id="teacher", username="teacher", session=session)
+    User.create(user_id="student", username="student", session=session)
+    group = Group.create(
+        name="Group", usernames=["student"], owner_user_id="teacher", session=session
+    )
+    session.expire_all()
+
+    plans = _query_plans(
+        session, lambda: Group.get_groups(session, owner_user_id="teacher")
+    )
+    assert "USING INDEX ix_groups_owner_id" in plans
+
+    plans = _query_plans(session, lambda: User.get_by_user_id("student", session))
+    assert "ix_group_user_association_user_id_group_id (user_id=?)" in plans
+
+    plans = _query_plans(
+        session,
+        lambda: Group.get_students(group["id"], session, limit=10, after_id=0),
+    )
+    assert "(group_id=? AND user_id>?)" in plans
+    assert "TEMP B-TREE" not in plans
@@ -1,7 +1,9 @@
 import pytest
+from sqlalchemy import insert
 from sqlalchemy.exc import IntegrityError
 
-from user_group_db.models import User
+from user_group_db.models import Group, ReservedUsername, User
+from username_index import UsernameIndex
 
 
 def test_create_user(session):
@@ -26,3 +28,249 @@ def test_get_user_by_user_id(session):
 def test_get_user_by_user_id_not_found(session):
     user = User.get_by_user_id("123456789", session)
     assert user is None
+
+
+def test_lookup_by_user_id_and_username(session):
+    User.create(user_id="123456789", username="TestUser", session=session)
+    assert User.get_user_id_by_username("TestUser", session) == "123456789"
+    assert User.username_exists("TestUser", session) is True
+    assert User.username_exists("Unknown", session) is False
+
+
+def test_set_user_id(session):
+    User.create(username="TestUser", session=session)
+    assert User.set_user_id("TestUser", "123456789", session) is True
+    assert User.get_user_id_by_username("TestUser", session) == "123456789"
+    assert User.set_user_id("Unknown", "1", session) is False
+
+
+def test_set_activated(session):
+    User.create(user_id="123456789", username="TestUser", session=session)
+    assert User.get_lookup("123456789", session)["is_activated"] is False
+    assert User.set_activated("TestUser", True, session) is True
+    assert User.set_activated("TestUser", True, session) is False
+    assert User.get_lookup("123456789", session)["is_activated"] is True
+    assert User.set_activated("Unknown", True, session) is None
+
+
+def test_get_lookup(session):
+    User.create(user_id="123456789", username="TestUser", session=session)
+    assert User.get_lookup("123456789", session) == {
+        "username": "TestUser",
+        "is_activated": False,
+    }
+    assert User.get_lookup("987654321", session) is None
+
+
+def test_batch_lookups(session):
+    User.create(user_id="1", username="first", is_activated=True, session=session)
+    User.create(user_id="2", username="second", session=session)
+
+    assert User.get_usernames_by_user_ids(["1", "2", "3"], session) == {
+        "1": "first",
+        "2": "second",
+        "3": None,
+    }
+    assert User.get_user_ids_by_usernames(["first", "unknown"], session) == {
+        "first": "1",
+        "unknown": None,
+    }
+    assert User.get_existing_usernames(["first", "unknown"], session) == {"first"}
+    assert User.get_activated_by_user_ids(["1", "2", "3"], session) == {
+        "1": True,
+        "2": False,
+        "3": False,
+    }
+
+
+def test_batch_lookups_with_empty_input(session):
+    assert User.get_usernames_by_user_ids([], session) == {}
+    assert User.get_user_ids_by_usernames([], session) == {}
+    assert User.get_existing_usernames([], session) == set()
+    assert User.get_activated_by_user_ids([], session) == {}
+
+
+def test_get_all_counts_groups(session):
+    User.create(user_id="1", username="first", session=session)
+    User.create(user_id="2", username="second", session=session)
+    Group.create(name="A", usernames=["first"], session=session)
+    Group.create(name="B", usernames=["first"], session=session)
+
+    users = {user["user_id"]: user for user in User.get_all(session)}
+    assert users["1"]["groups_count"] == 2
+    assert users["2"]["groups_count"] == 0
+    assert users["1"]["username"] == "first"
+    assert users["1"]["is_activated"] is True
+
+
+def test_get_all_runs_single_query(session, count_queries):
+    for index in range(10):
+        User.create(user_id=str(index), username=f"user-{index}", session=session)
+        Group.create(
+            name=f"Group {index}", usernames=[f"user-{index}"], session=session
+        )
+
+    session.expire_all()
+    count_queries.clear()
+
+    assert len(User.get_all(session)) == 10
+    assert len(count_queries) == 1
+
+
+def test_get_all_brief(session):
+    User.create(user_id="1", username="first", is_activated=True, session=session)
+    assert User.get_all_brief(session) == [
+        {"id": 1, "user_id": "1", "username": "first", "is_activated": True}
+    ]
+
+
+def test_get_all_keyset_pagination(session):
+    for index in range(5):
+        User.create(user_id=str(index), username=f"user-{index}", session=session)
+
+    first_page = User.get_all(session, limit=2)
+    assert [user["user_id"] for user in first_page] == ["0", "1"]
+    second_page = User.get_all(session, limit=2, after_id=first_page[-1]["id"])
+    assert [user["user_id"] for user in second_page] == ["2", "3"]
+    last_page = User.get_all_brief(session, limit=2, after_id=second_page[-1]["id"])
+    assert [user["user_id"] for user in last_page] == ["4"]
+
+
+def test_pick_free_username_checks_candidates_in_one_query(session, count_queries):
+    User.create(username="HappyPanda", session=session)
+    User.create(username="SillyOwl", session=session)
+    count_queries.clear()
+
+    assert (
+        User.pick_free_username(["HappyPanda", "SillyOwl", "BraveFox"], session)
+        == "BraveFox"
+    )
+    assert User.pick_free_username(["HappyPanda"], session) is None
+    assert len(count_queries) == 2
+
+
+def test_reserved_usernames_skip_taken_and_duplicates(session):
+    User.create(username="HappyPanda", session=session)
+    assert ReservedUsername.add_many(["HappyPanda", "SillyOwl"], session) == 1
+    assert ReservedUsername.add_many(["SillyOwl", "BraveFox"], session) == 1
+    assert ReservedUsername.count(session) == 2
+
+
+def test_reserved_usernames_are_not_free(session):
+    ReservedUsername.add_many(["SillyOwl"], session)
+    User.create(username="HappyPanda", session=session)
+    assert User.get_unavailable_usernames(
+        ["SillyOwl", "HappyPanda", "BraveFox"], session
+    ) == {"SillyOwl", "HappyPanda"}
+    assert User.pick_free_username(["SillyOwl", "BraveFox"], session) == "BraveFox"
+
+
+def test_take_skips_reserved_usernames_taken_meanwhile(session):
+    ReservedUsername.add_many(["SillyOwl", "BraveFox", "QuietElk"], session)
+    User.create(username="SillyOwl", session=session)
+    assert ReservedUsername.take(session) == "BraveFox"
+    assert ReservedUsername.take_many(2, session) == ["QuietElk"]
+    assert ReservedUsername.count(session) == 0
+
+
+def test_take_reserved_username(session):
+    ReservedUsername.add_many(["SillyOwl"], session)
+    ReservedUsername.add_many(["BraveFox"], session)
+    assert ReservedUsername.take(session) == "SillyOwl"
+    assert ReservedUsername.take(session) == "BraveFox"
+    assert ReservedUsername.take(session) is None
+    assert ReservedUsername.count(session) == 0
+
+
+def test_username_index_skips_definite_negatives(session, count_queries, mocker):
+    index = UsernameIndex("set", capacity=100, error_rate=0.01)
+    mocker.patch("user_group_db.models.username_index", index)
+    User.create(username="HappyPanda", session=session)
+    index.load(User.iter_usernames(session, batch_size=1))
+    User.create(username="SillyOwl", session=session)
+    count_queries.clear()
+
+    assert not User.username_exists("BraveFox", session)
+    assert User.get_existing_usernames(["BraveFox", "QuietElk"], session) == set()
+    assert count_queries == []
+    # only the username pool is queried
+    assert User.pick_free_username(["BraveFox"], session) == "BraveFox"
+    assert len(count_queries) == 1
+
+    assert User.username_exists("SillyOwl", session)
+    assert User.get_existing_usernames(["HappyPanda", "BraveFox"], session) == {
+        "HappyPanda"
+    }
+
+
+def test_membership_changes_do_not_trust_username_index(session, mocker):
+    index = UsernameIndex("set", capacity=100, error_rate=0.01)
+    mocker.patch("user_group_db.models.username_index", index)
+    User.create(username="kid", session=session)
+    index.load(User.iter_usernames(session))
+    # created by another process, so unknown to this index
+    session.execute(insert(User).values(username="newkid", is_activated=True))
+    session.commit()
+    group = Group.create(name="Class", usernames=["kid", "newkid"], session=session)
+    assert group["not_found_usernames"] == []
+
+    result = Group.sync_roster(group["id"], ["kid", "newkid"], session)
+    assert result["removed"] == []
+    assert result["not_found"] == []
+    assert User.resolve_usernames(["newkid"], session)[1] == []
+
+
+def test_create_many_inserts_users_in_one_statement(session, count_queries):
+    group = Group.create(name="Class", session=session)
+    count_queries.clear()
+
+    created = User.create_many(
+        [
+            {"user_id": "1", "username": "HappyPanda"},
+            {"user_id": "2", "username": "SillyOwl"},
+        ],
+        session,
+        group_id=group["id"],
+    )
+    assert sorted((user["user_id"], user["username"]) for user in created) == [
+        ("1", "HappyPanda"),
+        ("2", "SillyOwl"),
+    ]
+    # users insert, association insert and group counter
+    assert len(count_queries) == 3
+    assert User.get_activated_by_user_ids(["1", "2"], session) == {"1": True, "2": True}
+    assert Group.get_by_name("Class", session)["users_count"] == 2
+    assert User.get_existing_user_ids(["1", "3"], session) == {"1"}
+
+
+def test_take_many_reserved_usernames(session):
+    ReservedUsername.add_many(["A", "B", "C"], session)
+    assert sorted(ReservedUsername.take_many(2, session)) == ["A", "B"]
+    assert ReservedUsername.take_many(5, session) == ["C"]
+    assert ReservedUsername.take_many(1, session) == []
+
+
+def test_delete_many_in_constant_statements(session, count_queries):
+    User.create(user_id="teacher", username="teacher", session=session)
+    User.create(user_id="student", username="student", session=session)
+    User.create(user_id="other", username="other", session=session)
+    group = Group.create(
+        name="Class",
+        usernames=["student", "other"],
+        owner_user_id="teacher",
+        session=session,
+    )
+    session.expire_all()
+    count_queries.clear()
+
+    assert sorted(User.delete_many(["teacher", "student", "missing"], session)) == [
+        "student",
+        "teacher",
+    ]
+    # group counters, memberships delete, owner reset and users delete
+    assert len(count_queries) == 4
+
+    group_data = Group.get_by_id(group["id"], session)
+    assert group_data["owner"] is None
+    assert group_data["users_count"] == 1
+    assert User.delete_many([], session) == []